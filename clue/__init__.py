@@ -15,14 +15,24 @@
 ############
 
 import os
-
-import clash
+import sys
 
 
 def main():
-    clash.dispatch(config_path=os.path.join(os.path.dirname(__file__),
-                                            'blueprint',
-                                            'clash.yaml'))
+    from clue import config
+    if '_ARGCOMPLETE' in os.environ:
+        from clue import completion
+        completion.fast_complete(config.CONFIG_PATH)
+    elif sys.argv[1:] == ['git', 'prompt']:
+        from clue import prompt
+        prompt.fast_prompt()
+    elif sys.argv[1:2] != ['server'] and not os.environ.get('CLUE_NO_SERVER'):
+        socket_path = config.server_socket_path()
+        if os.path.exists(socket_path):
+            from clue import server
+            server.forward(socket_path)
+    import clash
+    clash.dispatch(config_path=config.CONFIG_PATH)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,138 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import atexit
+import os
+import subprocess
+import threading
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(git_dir):
+    git_dir = os.path.abspath(os.path.expanduser(git_dir))
+    with _readers_lock:
+        reader = _readers.get(git_dir)
+        if reader is None:
+            reader = ObjectReader(git_dir)
+            _readers[git_dir] = reader
+        return reader
+
+
+def close_all():
+    with _readers_lock:
+        for reader in _readers.values():
+            reader.close()
+        _readers.clear()
+
+
+atexit.register(close_all)
+
+
+class GitObject(object):
+
+    def __init__(self, object_id, object_type, size, content=None):
+        self.object_id = object_id
+        self.type = object_type
+        self.size = size
+        self.content = content
+
+    @property
+    def message(self):
+        # commit and tag objects only
+        _, _, message = self.content.partition('\n\n')
+        return message
+
+
+class ObjectReader(object):
+    # objects and revisions are read through long lived
+    # 'git cat-file --batch' and 'git cat-file --batch-check' processes
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._processes = {}
+        self._lock = threading.Lock()
+
+    def read(self, rev):
+        return self._request('--batch', rev)
+
+    def info(self, rev):
+        return self._request('--batch-check', rev)
+
+    def resolve(self, rev):
+        git_object = self.info(rev)
+        return git_object.object_id if git_object else None
+
+    def close(self):
+        with self._lock:
+            for process in self._processes.values():
+                _terminate(process)
+            self._processes.clear()
+
+    def _request(self, mode, rev):
+        if not rev or '\n' in rev:
+            raise ValueError('Illegal revision: {0!r}'.format(rev))
+        with self._lock:
+            try:
+                return self._communicate(mode, rev)
+            except (IOError, OSError, ValueError):
+                # the process died (e.g. the repository was moved),
+                # start a new one and retry once
+                _terminate(self._processes.pop(mode, None))
+                return self._communicate(mode, rev)
+
+    def _communicate(self, mode, rev):
+        process = self._process(mode)
+        process.stdin.write('{0}\n'.format(rev))
+        process.stdin.flush()
+        header = process.stdout.readline()
+        if not header:
+            raise IOError('git cat-file {0} exited'.format(mode))
+        header = header.rstrip('\n')
+        # the rev is echoed back as is and may contain spaces
+        if header.endswith((' missing', ' ambiguous')):
+            return None
+        object_id, object_type, size = header.rsplit(' ', 2)
+        size = int(size)
+        content = None
+        if mode == '--batch':
+            content = process.stdout.read(size)
+            process.stdout.read(1)
+        return GitObject(object_id, object_type, size, content)
+
+    def _process(self, mode):
+        process = self._processes.get(mode)
+        if process is None or process.poll() is not None:
+            with open(os.devnull, 'w') as devnull:
+                process = subprocess.Popen(
+                    ['git', '--git-dir', self.git_dir, 'cat-file', mode],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=devnull,
+                    close_fds=True)
+            self._processes[mode] = process
+        return process
+
+
+def _terminate(process):
+    if process is None:
+        return
+    try:
+        process.stdin.close()
+        process.wait()
+    except (IOError, OSError):
+        pass
@@ -14,10 +14,177 @@
 # limitations under the License.
 ############
 
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
 from cloudify import ctx
 
+# files shared with clue itself are written and locked the same way
+from clue.store import atomic_write  # noqa
+from clue.store import file_lock  # noqa
+
+
+# command output lines are logged in batches. a batch is logged once it
+# reaches OUTPUT_CHUNK_SIZE bytes or its first line is older than
+# OUTPUT_FLUSH_INTERVAL seconds, when the command switches between stdout
+# and stderr, and when the command ends
+OUTPUT_CHUNK_SIZE = 64 * 1024
+OUTPUT_FLUSH_INTERVAL = 0.1
+# optional limit (bytes per second) on logged output of each command
+OUTPUT_MAX_RATE = int(os.environ.get('CLUE_OUTPUT_MAX_RATE') or 0)
+
 
 def bake(command):
-    logger = ctx.logger
-    return command.bake(_out=lambda line: logger.info(line.strip()),
-                        _err=lambda line: logger.warn(line.strip()))
+    return LoggedCommand(command, ctx.logger)
+
+
+class LoggedCommand(object):
+    # wraps an sh command so that every call logs its output. the last batch
+    # is logged when the call returns, after sh read all of the output
+
+    def __init__(self, command, logger):
+        self._command = command
+        self._logger = logger
+
+    def bake(self, *args, **kwargs):
+        return LoggedCommand(self._command.bake(*args, **kwargs),
+                             self._logger)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return LoggedCommand(getattr(self._command, name), self._logger)
+
+    def __call__(self, *args, **kwargs):
+        stream = OutputStream(self._logger.info, self._logger.warn)
+        kwargs.update({'_out': stream.write, '_err': stream.write_err})
+        try:
+            return self._command(*args, **kwargs)
+        finally:
+            stream.flush()
+
+
+@contextmanager
+def captured_logs(logger):
+    # the logs of an operation are collected instead of written, so a
+    # workflow can write the output of each operation in one piece
+    handlers = [h for h in logger.handlers if hasattr(h, 'out_func')]
+    out_funcs = [h.out_func for h in handlers]
+    captured = []
+    for handler in handlers:
+        handler.out_func = captured.append
+    try:
+        yield captured
+    except Exception:
+        for handler, out_func in zip(handlers, out_funcs):
+            handler.out_func = out_func
+        if out_funcs:
+            for log in captured:
+                out_funcs[0](log)
+        raise
+    finally:
+        for handler, out_func in zip(handlers, out_funcs):
+            handler.out_func = out_func
+
+
+class OutputStream(object):
+
+    def __init__(self, log, err_log=None, max_rate=None):
+        self._log = log
+        self._err_log = err_log or log
+        self._max_rate = OUTPUT_MAX_RATE if max_rate is None else max_rate
+        self._batch_log = log
+        self._lines = []
+        self._size = 0
+        self._first_line_time = None
+        self._rate_start = None
+        self._rate_bytes = 0
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        self._write(line, self._log)
+
+    def write_err(self, line):
+        self._write(line, self._err_log)
+
+    def _write(self, line, log):
+        with self._lock:
+            if self._lines and log != self._batch_log:
+                # stdout and stderr lines are logged in the order they came
+                self._flush()
+            self._batch_log = log
+            now = time.time()
+            if not self._lines:
+                self._first_line_time = now
+            self._lines.append(line.rstrip('\n'))
+            self._size += len(line)
+            if (self._size >= OUTPUT_CHUNK_SIZE or
+                    now - self._first_line_time >= OUTPUT_FLUSH_INTERVAL):
+                self._flush()
+            else:
+                _flusher.watch(self)
+
+    def flush(self, stale_only=False):
+        with self._lock:
+            if stale_only and self._lines and (
+                    time.time() - self._first_line_time <
+                    OUTPUT_FLUSH_INTERVAL):
+                return
+            self._flush()
+
+    def _flush(self):
+        if not self._lines:
+            return
+        message = '\n'.join(self._lines)
+        size = self._size
+        self._lines = []
+        self._size = 0
+        self._throttle(size)
+        self._batch_log(message)
+
+    def _throttle(self, size):
+        if not self._max_rate:
+            return
+        now = time.time()
+        if self._rate_start is None:
+            self._rate_start = now
+        self._rate_bytes += size
+        elapsed = now - self._rate_start
+        delay = self._rate_bytes / float(self._max_rate) - elapsed
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Flusher(object):
+    # logs batches of running commands that stopped producing output for a
+    # while. the last batch of a command is logged by LoggedCommand
+
+    def __init__(self):
+        self._streams = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, stream):
+        with self._lock:
+            self._streams[stream] = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(OUTPUT_FLUSH_INTERVAL)
+            with self._lock:
+                streams = self._streams.keys()
+                self._streams.clear()
+            for stream in streams:
+                stream.flush(stale_only=True)
+                if stream._lines:
+                    self.watch(stream)
+
+
+_flusher = _Flusher()
@@ -0,0 +1,82 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import json
+import os
+import threading
+import time
+
+import yaml
+
+from common import atomic_write
+from common import file_lock
+
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class FileCache(object):
+
+    def __init__(self, parse):
+        self._parse = parse
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, file_path):
+        file_path = os.path.abspath(file_path)
+        with self._lock:
+            try:
+                f = open(file_path)
+            except IOError:
+                self._entries.pop(file_path, None)
+                return None
+            with f:
+                stat = os.fstat(f.fileno())
+                key = (stat.st_mtime, stat.st_size, stat.st_ino)
+                entry = self._entries.get(file_path)
+                if entry and entry[0] == key:
+                    return entry[1]
+                value = self._parse(f.read())
+            self._entries[file_path] = (key, value)
+            return value
+
+
+class TTLCache(object):
+
+    def __init__(self, file_path):
+        self.file_path = os.path.abspath(file_path)
+
+    def get(self, key):
+        entry = (json_files.load(self.file_path) or {}).get(key)
+        if not entry or entry['expires'] < time.time():
+            return None
+        return entry['value']
+
+    def set(self, key, value, ttl):
+        with file_lock('{0}.lock'.format(self.file_path)):
+            now = time.time()
+            entries = dict((k, entry) for k, entry in
+                           (json_files.load(self.file_path) or {}).items()
+                           if entry['expires'] >= now)
+            entries[key] = {'value': value, 'expires': now + ttl}
+            atomic_write(self.file_path, json.dumps(entries))
+
+
+def _parse_yaml(content):
+    return yaml.load(content, Loader=YamlLoader)
+
+
+json_files = FileCache(json.loads)
+yaml_files = FileCache(_parse_yaml)
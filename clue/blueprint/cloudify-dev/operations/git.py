@@ -14,21 +14,61 @@
 # limitations under the License.
 ############
 
-import json
+import hashlib
 import os
 import sys
+import time
+from multiprocessing.pool import ThreadPool
 
 import sh
-import yaml
 from path import path
 
 from cloudify import ctx
 from cloudify.workflows import ctx as workflow_ctx
 from cloudify import exceptions
+from cloudify import logs
 from cloudify.decorators import operation
 from cloudify.decorators import workflow
 
 from common import bake
+from common import captured_logs
+from common import file_lock
+import catfile
+import filecache
+import porcelain
+import refs
+import scheduler
+import versions
+
+# thread pool size for workflows that scan all repos in-process
+SCAN_POOL_SIZE = 10
+
+# git pull fetch scheduling defaults
+FETCH_MAX_CONNECTIONS_PER_HOST = 4
+FETCH_RETRIES = 5
+FETCH_RETRY_INTERVAL = 1
+FETCH_MAX_RETRY_INTERVAL = 30
+FETCH_UNCHANGED = 'unchanged'
+FETCH_UPDATED = 'updated'
+
+# hub operations defaults
+HUB_MAX_CONNECTIONS_PER_HOST = 4
+CI_STATUS_CACHE_TTL = 30
+CI_STATUS_CACHE_FILE = 'ci-status-cache.json'
+
+# order in which git_execute_operation writes the output of each repo
+OUTPUT_REPO_ORDER = 'repo_order'
+OUTPUT_FIRST_FINISHED = 'first_finished'
+
+# seconds between checks for finished tasks in workflows that start tasks
+# one by one
+TASK_POLL_INTERVAL = 0.05
+
+# clone mode -> (partial clone filter, minimal git version)
+CLONE_FILTERS = {
+    'blobless': ('blob:none', (2, 19)),
+    'treeless': ('tree:0', (2, 20)),
+}
 
 
 class GitRepo(object):
@@ -39,16 +79,11 @@ class GitRepo(object):
         self.git_version = sh.git(version=True).stdout.strip()
         if self.repo_location.isdir():
             return
-        if self.clone_method == 'https':
-            clone_url = 'https://github.com/{}/{}.git'.format(
-                self.organization, self.name)
-        elif self.clone_method == 'ssh':
-            clone_url = 'git@github.com:{}/{}.git'.format(
-                self.organization, self.name)
-        else:
-            raise exceptions.NonRecoverableError(
-                'Illegal clone method: {0}'.format(self.clone_method))
-        git.clone(clone_url, self.repo_location, '-b', self.branch).wait()
+        if self.mirrors_dir:
+            self._clone_from_mirror()
+            return
+        git.clone(self.clone_url, self.repo_location, '-b', self.branch,
+                  *self._clone_mode_args()).wait()
 
     def configure(self):
         # configure commit-msg hook
@@ -64,88 +99,172 @@ class GitRepo(object):
         if self.type == 'versions':
             self.versions_repo_location = self.repo_location
 
-    def pull(self):
+    def pull(self, **fetch_kwargs):
+        if self.fetch(**fetch_kwargs):
+            return self.merge()
+
+    def fetch(self,
+              max_connections_per_host=FETCH_MAX_CONNECTIONS_PER_HOST,
+              retries=FETCH_RETRIES,
+              retry_interval=FETCH_RETRY_INTERVAL,
+              max_retry_interval=FETCH_MAX_RETRY_INTERVAL,
+              skip_unchanged=True):
+        remote = self.upstream_remote
+        if not remote:
+            ctx.logger.info('No upstream defined. Skipping pull.')
+            return None
+        retries = int(retries)
         try:
-            self.git_output('rev-parse', '@{u}')
+            remote_url = self.git_output.config(
+                'remote.{0}.url'.format(remote)).stdout.strip()
         except sh.ErrorReturnCode:
-            ctx.logger.info('No upstream defined. Skipping pull.')
-            return
+            remote_url = ''
+
+        def on_retry(attempt, delay, error):
+            ctx.logger.warn('Fetch failed, retrying in {0:.1f} seconds '
+                            '[{1}/{2}]'.format(delay, attempt, retries))
+        try:
+            return scheduler.run_with_backoff(
+                lambda: self._fetch(remote, remote_url, skip_unchanged),
+                host=scheduler.remote_host(remote_url),
+                limit=int(max_connections_per_host),
+                retries=retries,
+                interval=float(retry_interval),
+                max_interval=float(max_retry_interval),
+                retry_on=sh.ErrorReturnCode,
+                on_retry=on_retry)
+        except sh.ErrorReturnCode:
+            ctx.logger.error('Fetch failed after {0} retries.'.format(retries))
+            return False
+
+    def _fetch(self, remote, remote_url, skip_unchanged):
+        remote_refs = None
+        if skip_unchanged:
+            remote_refs = self._remote_refs(remote, remote_url)
+            if remote_refs and self._remote_refs_unchanged(remote,
+                                                           remote_refs):
+                ctx.logger.info('Remote unchanged. Skipping fetch.')
+                return FETCH_UNCHANGED
         kwargs = {'prune': True}
-        if self.git_version >= 'git version 2.0.0':
+        if self.git_version_info >= (2, 0):
             kwargs['tags'] = True
-        self.git.pull(**kwargs).wait()
+        self.git.fetch(remote, **kwargs).wait()
+        if remote_refs:
+            self.runtime_properties['remote_refs'] = remote_refs
+        return FETCH_UPDATED
+
+    def _remote_refs(self, remote, remote_url):
+        # tip of the tracked upstream branch and a digest of all remote tags
+        upstream_ref = self.upstream_ref
+        if not upstream_ref:
+            return None
+        output = self.git_output('ls-remote', remote, upstream_ref,
+                                 'refs/tags/*').stdout
+        upstream_tip = None
+        tags = hashlib.sha1()
+        for line in output.splitlines():
+            object_id, _, name = line.strip().partition('\t')
+            if name == upstream_ref:
+                upstream_tip = object_id
+            elif name.startswith('refs/tags/'):
+                tags.update('{0} {1}\n'.format(object_id, name))
+        if not upstream_tip:
+            return None
+        return {
+            'url': remote_url,
+            'upstream_ref': upstream_ref,
+            'upstream_tip': upstream_tip,
+            'tags': tags.hexdigest()
+        }
+
+    def _remote_refs_unchanged(self, remote, remote_refs):
+        if self.runtime_properties.get('remote_refs') != remote_refs:
+            return False
+        # the local remote tracking branch must also still be at the tip
+        # that was last seen on the remote
+        tracking_ref = 'refs/remotes/{0}/{1}'.format(
+            remote, remote_refs['upstream_ref'][len('refs/heads/'):])
+        ref_store = self.ref_store
+        if ref_store.supported:
+            tracking_tip = ref_store.read_ref(tracking_ref)
+        else:
+            tracking_tip = self.objects.resolve(tracking_ref)
+        return tracking_tip == remote_refs['upstream_tip']
+
+    def merge(self):
+        if not self.upstream_remote:
+            return None
+        try:
+            self.git.merge('@{u}', ff_only=True).wait()
+        except sh.ErrorReturnCode:
+            ctx.logger.error('Could not fast-forward {0} to its upstream.'
+                             .format(self.current_branch))
+            return False
+        return True
 
     def status(self, active):
         if active and not self.active_feature.branch:
             return
-        for git_prompt_path in self.git_prompt_paths:
-            if git_prompt_path.expanduser().exists():
-                break
-        else:
-            git_prompt_path = None
-        if git_prompt_path:
-            script_path = ctx.download_resource_and_render(
-                'resources/git-branch-state.sh', template_variables={
-                    'git_prompt_path': git_prompt_path,
-                    'repo_location': self.repo_location})
-            try:
-                os.chmod(script_path, 0o755)
-                script = sh.Command(script_path)
-                branch_state = script().stdout.strip()
-            finally:
-                os.remove(script_path)
-        else:
-            branch_state = self.current_branch
-        ctx.logger.info(branch_state)
-        self.git.status(s=True).wait()
+        if self.git_version_info < porcelain.PORCELAIN_V2_VERSION:
+            ctx.logger.info(self.current_branch)
+            self.git.status(s=True).wait()
+            return
+        args = ['--porcelain=v2', '--branch']
+        show_stash = self.git_version_info >= porcelain.SHOW_STASH_VERSION
+        if show_stash:
+            args.append('--show-stash')
+        output = self.git_output.status(*args).stdout
+        branch_state = porcelain.parse(output)
+        git_dir = self.repo_location / '.git'
+        if not show_stash and porcelain.has_stash(git_dir):
+            branch_state.stash = 1
+        porcelain.read_operation(branch_state, git_dir)
+        ctx.logger.info(branch_state.branch_state())
+        for line in branch_state.short_status():
+            ctx.logger.info(line)
 
     def checkout(self, branch):
-        versions_prefix = '::'
-        default_branch = self.branch
-        active_feature = self.active_feature
-        if branch.startswith(versions_prefix):
-            versions_branch = branch[len(versions_prefix):]
-            components = self._read_versions_file(versions_branch)
-            if self.name in components:
-                branch = components[self.name]
-            elif self.type in ['core', 'versions']:
-                branch = versions_branch
-            else:
-                branch = default_branch
-        elif active_feature.name == branch:
-            branch = active_feature.branch
-            base_branch = active_feature.base
-            if not branch:
-                if base_branch.startswith(versions_prefix):
-                    versions_branch = base_branch[len(versions_prefix):]
-                    components = self._read_versions_file(versions_branch)
-                    if self.name in components:
-                        branch = components[self.name]
-                    elif self.type in ['core', 'versions']:
-                        branch = versions_branch
-                    else:
-                        branch = default_branch
-                else:
-                    if self.type in ['core', 'versions']:
-                        branch = base_branch
-                    else:
-                        branch = default_branch
-        elif branch == 'default':
-            branch = default_branch
-        elif self.type == 'misc':
+        target, _ = self._checkout_target(branch)
+        if not target:
             return
-        elif self.type not in ['core', 'plugin', 'versions']:
-            raise exceptions.NonRecoverableError('Unhandled repo type: {}'
-                                                 .format(self.type))
-        elif not branch:
-            raise exceptions.NonRecoverableError('Branch is not defined')
-        elif branch.startswith('.'):
-            branch = self._fix_branch_name(branch)
         try:
-            if self.current_branch != branch:
-                self.git.checkout(branch).wait()
+            if self.current_branch != target:
+                self.git.checkout(target).wait()
+        except sh.ErrorReturnCode:
+            ctx.logger.error('Could not checkout branch {0}'.format(target))
+
+    def checkout_preflight(self, branch, feature=None):
+        result = {'target': None, 'previous': None, 'error': None}
+        target, required = self._checkout_target(branch, feature)
+        current_branch = self.current_branch
+        if not target or target == current_branch:
+            return result
+        target_commit = self._checkout_commit(target)
+        if not target_commit:
+            if required:
+                result['error'] = 'Branch {0} does not exist'.format(target)
+                ctx.logger.error(result['error'])
+            else:
+                ctx.logger.warn('Branch {0} does not exist. Skipping.'
+                                .format(target))
+            return result
+        error = self._checkout_blocker(target_commit)
+        if error:
+            result['error'] = error
+            ctx.logger.error('Cannot checkout {0}: {1}'.format(target, error))
+            return result
+        if current_branch == 'HEAD':
+            current_branch = self.objects.resolve('HEAD')
+        result.update({'target': target, 'previous': current_branch})
+        return result
+
+    def checkout_branch(self, branch):
+        try:
+            self.git.checkout(branch).wait()
         except sh.ErrorReturnCode:
             ctx.logger.error('Could not checkout branch {0}'.format(branch))
+            return False
+        return True
 
     def reset(self, hard, origin):
         if not self.validate_active_feature():
@@ -159,6 +278,7 @@ class GitRepo(object):
         base = self.active_feature.base
         try:
             base = self._fix_branch_name(base)
+            self._ensure_history()
             self.git.rebase(base).wait()
         except Exception as e:
             ctx.logger.error('Failed rebase, aborting: {0}'.format(e))
@@ -176,6 +296,7 @@ class GitRepo(object):
         git = self.git_output
         base = self.active_feature.base
         base = self._fix_branch_name(base)
+        self._ensure_history()
         merge_base = git.bake('merge-base', fork_point=True)(
                 base).stdout.strip()
         commits = git.bake(
@@ -187,8 +308,8 @@ class GitRepo(object):
             ctx.logger.info('Single commit found. Skipping squash.')
             return
         commit_message_sha = commits[-1]
-        commit_message = git.log(commit_message_sha,
-                                 format='%B', n=1).stdout.strip()
+        commit_message = self.objects.read(
+            commit_message_sha).message.strip()
         git = self.git
         ctx.logger.info(
             'Squashing with merge_base: {0} and commit message: {1}'
@@ -237,6 +358,8 @@ class GitRepo(object):
                 self.git.branch(delete_flag, branch).wait()
             except sh.ErrorReturnCode:
                 ctx.logger.error('Failed deleting branch {0}.'.format(branch))
+                return False
+        return True
 
     def branch_exists(self, branch):
         return self._branch_exists(branch)
@@ -265,6 +388,43 @@ class GitRepo(object):
     def clone_method(self):
         return self.properties['clone_method']
 
+    @property
+    def clone_url(self):
+        clone_url = self.properties['clone_url']
+        if clone_url:
+            return clone_url.format(organization=self.organization,
+                                    name=self.name)
+        if self.clone_method == 'https':
+            return 'https://github.com/{}/{}.git'.format(
+                self.organization, self.name)
+        elif self.clone_method == 'ssh':
+            return 'git@github.com:{}/{}.git'.format(
+                self.organization, self.name)
+        raise exceptions.NonRecoverableError(
+            'Illegal clone method: {0}'.format(self.clone_method))
+
+    @property
+    def clone_mode(self):
+        return self.properties['clone_mode']
+
+    @property
+    def clone_depth(self):
+        return int(self.properties['clone_depth'])
+
+    @property
+    def mirrors_dir(self):
+        mirrors_dir = self.properties['mirrors_dir']
+        return path(mirrors_dir).expanduser() if mirrors_dir else None
+
+    @property
+    def mirror_location(self):
+        return self.mirrors_dir / self.organization / '{0}.git'.format(
+            self.name)
+
+    @property
+    def mirror_dissociate(self):
+        return self.properties['mirror_dissociate']
+
     @property
     def type(self):
         return self.properties['repo_type']
@@ -273,10 +433,6 @@ class GitRepo(object):
     def git_config(self):
         return self.properties['git_config']
 
-    @property
-    def git_prompt_paths(self):
-        return [path(p) for p in self.properties['git_prompt_paths']]
-
     @property
     def git_version(self):
         return self.runtime_properties['git_version']
@@ -285,11 +441,46 @@ class GitRepo(object):
     def git_version(self, value):
         self.runtime_properties['git_version'] = value
 
+    @property
+    def git_version_info(self):
+        version = self.git_version.split()[2]
+        return tuple(int(v) for v in version.split('.')[:3] if v.isdigit())
+
     @property
     def current_branch(self):
+        ref_store = self.ref_store
+        if ref_store.supported:
+            return ref_store.current_branch()
         return self.git_output('rev-parse', '--abbrev-ref',
                                'HEAD').stdout.strip()
 
+    @property
+    def upstream_remote(self):
+        try:
+            return self.git_output.config('branch.{0}.remote'.format(
+                self.current_branch)).stdout.strip()
+        except sh.ErrorReturnCode:
+            return None
+
+    @property
+    def upstream_ref(self):
+        try:
+            upstream_ref = self.git_output.config('branch.{0}.merge'.format(
+                self.current_branch)).stdout.strip()
+        except sh.ErrorReturnCode:
+            return None
+        if not upstream_ref.startswith('refs/heads/'):
+            return None
+        return upstream_ref
+
+    @property
+    def ref_store(self):
+        return refs.get_store(self.repo_location / '.git')
+
+    @property
+    def objects(self):
+        return catfile.get_reader(self.repo_location / '.git')
+
     @property
     def git(self):
         return self._git(log_out=True)
@@ -306,10 +497,13 @@ class GitRepo(object):
     def runtime_properties(self):
         return ctx.instance.runtime_properties
 
+    @property
+    def storage_dir(self):
+        return path(ctx._endpoint.storage._root_storage_dir)
+
     @property
     def versions_repo_location(self):
-        with open(ctx._endpoint.storage._payload_path) as f:
-            return path(json.load(f)['versions_repo_location'])
+        return path(self.payload['versions_repo_location'])
 
     @versions_repo_location.setter
     def versions_repo_location(self, value):
@@ -320,22 +514,14 @@ class GitRepo(object):
                     'only one repository can be marked with "versions" type')
             payload['versions_repo_location'] = value
 
+    @property
+    def payload(self):
+        return filecache.json_files.load(
+            ctx._endpoint.storage._payload_path) or {}
+
     @property
     def active_feature(self):
-        with open(ctx._endpoint.storage._payload_path) as f:
-            active_feature = json.load(f).get('active_feature')
-        if not active_feature:
-            return Feature({})
-        branches = {}
-        features_file = path(self.properties['features_file'])
-        if features_file.exists():
-            branches = yaml.safe_load(features_file.text()) or {}
-        if not branches:
-            return Feature({})
-        name = active_feature
-        active_feature = Feature(branches.get(active_feature))
-        active_feature.name = name
-        return active_feature
+        return _active_feature(self.payload, self.properties['features_file'])
 
     def _git(self, log_out, repo_location=None):
         repo_location = repo_location or self.repo_location
@@ -360,19 +546,7 @@ class GitRepo(object):
         return True
 
     def _branch_exists(self, branch, local_only=False):
-        branch_exists = self.git_output.bake(
-                'show-ref', verify=True, quiet=True)
-        refs = ['refs/heads']
-        if not local_only:
-            refs.append('refs/remotes/origin')
-        for ref in refs:
-            try:
-                branch_exists('{0}/{1}'.format(ref, branch))
-            except sh.ErrorReturnCode:
-                pass
-            else:
-                return True
-        return False
+        return _branch_exists(self.repo_location, branch, local_only)
 
     def _fix_branch_name(self, branch):
         if not branch.startswith('.'):
@@ -382,41 +556,221 @@ class GitRepo(object):
         template = '3{}' if self.type == 'core' else '1{}'
         return template.format(branch)
 
+    def _clone_mode_args(self):
+        clone_mode = self.clone_mode
+        if clone_mode == 'full':
+            return []
+        elif clone_mode == 'shallow':
+            return ['--depth', str(self.clone_depth), '--no-single-branch']
+        elif clone_mode not in CLONE_FILTERS:
+            raise exceptions.NonRecoverableError(
+                'Illegal clone mode: {0}'.format(clone_mode))
+        clone_filter, required_version = CLONE_FILTERS[clone_mode]
+        if self.git_version_info < required_version:
+            ctx.logger.warn('git version >= {0} is required for {1} clones. '
+                            'Falling back to a full clone.'.format(
+                                '.'.join(str(v) for v in required_version),
+                                clone_mode))
+            return []
+        return ['--filter={0}'.format(clone_filter)]
+
+    def _ensure_history(self):
+        if not (self.repo_location / '.git' / 'shallow').exists():
+            return
+        ctx.logger.info('Shallow clone, fetching complete history.')
+        self.git.fetch(unshallow=True).wait()
+
+    def _clone_from_mirror(self):
+        mirror_location = self.mirror_location
+        self._update_mirror(mirror_location)
+        args = ['--reference', mirror_location]
+        if self.mirror_dissociate:
+            args.append('--dissociate')
+        bake(sh.git).clone(mirror_location, self.repo_location,
+                           '-b', self.branch, *args).wait()
+        self.git.remote('set-url', 'origin', self.clone_url).wait()
+
+    def _update_mirror(self, mirror_location):
+        git = bake(sh.git)
+        with file_lock('{0}.lock'.format(mirror_location)):
+            if not mirror_location.isdir():
+                git.clone(self.clone_url, mirror_location, bare=True).wait()
+                mirror_git = git.bake('--git-dir', mirror_location)
+                mirror_git.config('remote.origin.fetch',
+                                  '+refs/heads/*:refs/heads/*').wait()
+                # repos borrow objects from the mirror through alternates,
+                # so objects unreachable from the mirror refs are never pruned
+                mirror_git.config('gc.pruneExpire', 'never').wait()
+                return
+            kwargs = {'prune': True}
+            if self.git_version_info >= (2, 0):
+                kwargs['tags'] = True
+            try:
+                git('--git-dir', mirror_location, 'fetch', 'origin',
+                    **kwargs).wait()
+            except sh.ErrorReturnCode:
+                ctx.logger.warn('Failed updating mirror {0}, cloning from '
+                                'its current state.'.format(mirror_location))
+
+    def _checkout_target(self, branch, feature=None):
+        # returns the branch this repo should switch to (None to skip it)
+        # and whether the branch must exist for the checkout to proceed.
+        # feature overrides the stored active feature when it is not yet
+        # saved
+        versions_prefix = '::'
+        default_branch = self.branch
+        active_feature = Feature(feature) if feature else self.active_feature
+        if branch.startswith(versions_prefix):
+            return self._versions_branch(branch[len(versions_prefix):]), False
+        elif active_feature.name == branch:
+            feature_branch = active_feature.branch
+            if feature_branch:
+                return feature_branch, True
+            base_branch = active_feature.base
+            if base_branch.startswith(versions_prefix):
+                return self._versions_branch(
+                    base_branch[len(versions_prefix):]), False
+            elif self.type in ['core', 'versions']:
+                return base_branch, False
+            return default_branch, True
+        elif branch == 'default':
+            return default_branch, True
+        elif self.type == 'misc':
+            return None, False
+        elif self.type not in ['core', 'plugin', 'versions']:
+            raise exceptions.NonRecoverableError('Unhandled repo type: {}'
+                                                 .format(self.type))
+        elif not branch:
+            raise exceptions.NonRecoverableError('Branch is not defined')
+        elif branch.startswith('.'):
+            branch = self._fix_branch_name(branch)
+        return branch, False
+
+    def _versions_branch(self, versions_branch):
+        components = self._read_versions_file(versions_branch)
+        if self.name in components:
+            return components[self.name]
+        elif self.type in ['core', 'versions']:
+            return versions_branch
+        return self.branch
+
+    def _checkout_commit(self, target):
+        # the commit 'git checkout <target>' would switch to
+        for rev in ['refs/heads/{0}'.format(target),
+                    'refs/remotes/origin/{0}'.format(target),
+                    target]:
+            object_id = self.objects.resolve('{0}^{{commit}}'.format(rev))
+            if object_id:
+                return object_id
+        return None
+
+    def _checkout_blocker(self, target_commit):
+        state = porcelain.BranchState()
+        porcelain.read_operation(state, self.repo_location / '.git')
+        if state.operation:
+            return 'an operation is in progress ({0})'.format(
+                state.operation.strip('|'))
+        output = self.git_output.status('--porcelain', '-z',
+                                        '--untracked-files=all').stdout
+        changed_paths = set()
+        untracked_paths = set()
+        entries = iter(output.split('\0'))
+        for entry in entries:
+            if not entry or entry.startswith('!!'):
+                continue
+            xy, entry_path = entry[:2], entry[3:]
+            if xy == '??':
+                untracked_paths.add(entry_path)
+                continue
+            if 'U' in xy or xy in ['AA', 'DD']:
+                return 'unmerged path {0}'.format(entry_path)
+            changed_paths.add(entry_path)
+            if 'R' in xy or 'C' in xy:
+                changed_paths.add(next(entries, ''))
+        if changed_paths:
+            target_paths = set(self.git_output.diff(
+                '--name-only', '-z', 'HEAD',
+                target_commit).stdout.split('\0'))
+            conflicts = sorted(changed_paths & target_paths)
+            if conflicts:
+                return 'local changes to {0} would be overwritten'.format(
+                    ', '.join(conflicts))
+        if untracked_paths:
+            conflicts = self._untracked_conflicts(untracked_paths,
+                                                  target_commit)
+            if conflicts:
+                return 'untracked {0} would be overwritten'.format(
+                    ', '.join(conflicts))
+        return None
+
+    def _untracked_conflicts(self, untracked_paths, target_commit):
+        # untracked files are not in HEAD, so any of them the target tree
+        # has (as a file, a directory or a parent directory) blocks git
+        target_paths = self.git_output('ls-tree', '-r', '--name-only', '-z',
+                                       target_commit).stdout.split('\0')
+        target_dirs = set()
+        for target_path in target_paths:
+            parts = target_path.split('/')[:-1]
+            for i in range(len(parts)):
+                target_dirs.add('/'.join(parts[:i + 1]))
+        target_paths = set(target_paths)
+        conflicts = []
+        for untracked_path in sorted(untracked_paths):
+            parts = untracked_path.split('/')
+            parents = ['/'.join(parts[:i + 1])
+                       for i in range(len(parts) - 1)]
+            if (untracked_path in target_paths or
+                    untracked_path in target_dirs or
+                    target_paths.intersection(parents)):
+                conflicts.append(untracked_path)
+        return conflicts
+
     def _read_versions_file(self, versions_branch):
-        repo_git = self._git(
-            log_out=False,
-            repo_location=self.versions_repo_location)
-        try:
-            raw_versions = repo_git.show(
-                '{}:versions.yaml'.format(versions_branch)).stdout.strip()
-        except sh.ErrorReturnCode:
-            raw_versions = repo_git.show(
-                'origin/{}:versions.yaml'.format(
-                    versions_branch)).stdout.strip()
-        versions = yaml.safe_load(raw_versions)
-        return versions.get('components', {})
+        return versions.components(
+            versions_repo_location=self.versions_repo_location,
+            versions_branch=versions_branch,
+            cache_dir=self.storage_dir / 'versions-cache')
 repo = GitRepo()
 
 
 class Hub(object):
 
-    def ci_status(self):
+    def ci_status(self, max_connections_per_host=HUB_MAX_CONNECTIONS_PER_HOST,
+                  cache_ttl=CI_STATUS_CACHE_TTL):
         if not repo.validate_active_feature():
             return
-        try:
-            self.hub('ci-status', '-v').wait()
-        except sh.ErrorReturnCode:
-            pass
+        cache_ttl = int(cache_ttl)
+        sha = repo.objects.resolve('HEAD')
+        # a commit's ci status only changes as builds progress, so it is
+        # cached briefly by commit
+        key = '{0}:{1}'.format(repo.name, sha)
+        cache = filecache.TTLCache(repo.storage_dir / CI_STATUS_CACHE_FILE)
+        status = cache.get(key) if sha and cache_ttl > 0 else None
+        if status is None:
+            with self._connection(max_connections_per_host):
+                result = self.hub_output('ci-status', '-v', sha or 'HEAD',
+                                         _ok_code=[0, 1, 2, 3])
+            status = result.stdout.strip()
+            if not status:
+                ctx.logger.warn(result.stderr.strip() or
+                                'hub ci-status exited with code {0}'
+                                .format(result.exit_code))
+                return
+            if sha and cache_ttl > 0:
+                cache.set(key, status, cache_ttl)
+        ctx.logger.info(status)
 
-    def compare(self):
+    def compare(self, max_connections_per_host=HUB_MAX_CONNECTIONS_PER_HOST):
         if not repo.validate_active_feature():
             return
-        url = self.hub_output.compare(
-            '-u', '-b', repo.active_feature.base).stdout.strip()
+        with self._connection(max_connections_per_host):
+            url = self.hub_output.compare(
+                '-u', '-b', repo.active_feature.base).stdout.strip()
         import webbrowser
         webbrowser.open(url)
 
-    def pull_request(self, message, file):
+    def pull_request(self, message, file,
+                     max_connections_per_host=HUB_MAX_CONNECTIONS_PER_HOST):
         if not repo.validate_active_feature():
             return
         if message and file:
@@ -432,10 +786,16 @@ class Hub(object):
             message = repo.active_feature.branch
             command = command.bake('-m', message)
         try:
-            command()
+            with self._connection(max_connections_per_host):
+                command()
         except sh.ErrorReturnCode:
             pass
 
+    @staticmethod
+    def _connection(max_connections_per_host):
+        return scheduler.host_semaphore(scheduler.remote_host(repo.clone_url),
+                                        int(max_connections_per_host))
+
     @property
     def hub(self):
         return self._hub(log_out=True)
@@ -456,27 +816,366 @@ class Hub(object):
             hub = bake(hub)
         env = os.environ.copy()
         env.update({
-            'GIT_WORK_TREE': repo_location,
-            'GIT_DIR': repo_location / '.git'
+            'GIT_WORK_TREE': str(repo_location),
+            'GIT_DIR': str(repo_location / '.git')
         })
         return hub.bake(_env=env)
 hub = Hub()
 
 
 @workflow
-def check_branch_exists(branch, **_):
+def check_branch_exists(branch, batched=True, **_):
+    instances = [instance for instance in workflow_ctx.node_instances
+                 if instance.node.type == 'git_repo']
+    if batched:
+        return _scan_branch_exists(instances, branch)
     repos = []
-    for instance in workflow_ctx.node_instances:
-        if instance.node.type != 'git_repo':
-            continue
+    for instance in instances:
         exists = instance.execute_operation('git.branch_exists', kwargs={
             'branch': branch
         }).get()
         if exists:
-            repos.append(instance.node.id[:-len('-repo')])
+            repos.append(_repo_name(instance))
     return repos
 
 
+@workflow
+def git_pull(max_connections_per_host, retries, retry_interval,
+             max_retry_interval, skip_unchanged=True, **_):
+    # all repos are fetched first, then fast-forwarded locally. repos
+    # whose fetch failed are not merged
+    instances = sorted((instance for instance in workflow_ctx.node_instances
+                        if instance.node.type == 'git_repo'),
+                       key=_repo_name)
+    fetch_kwargs = {
+        'max_connections_per_host': max_connections_per_host,
+        'retries': retries,
+        'retry_interval': retry_interval,
+        'max_retry_interval': max_retry_interval,
+        'skip_unchanged': skip_unchanged
+    }
+    fetches = zip(instances, _fetch_all(instances, fetch_kwargs,
+                                        int(max_connections_per_host)))
+    for result, title in [(FETCH_UPDATED, 'Updated'),
+                          (FETCH_UNCHANGED, 'Skipped (remote unchanged)')]:
+        names = sorted(_repo_name(instance)
+                       for instance, r in fetches if r == result)
+        if names:
+            workflow_ctx.logger.info('{0}: {1}'.format(title,
+                                                       ', '.join(names)))
+    fetched = [instance for instance, result in fetches
+               if result in [FETCH_UPDATED, FETCH_UNCHANGED]]
+    merges = zip(fetched, _execute_all(fetched, 'git.merge',
+                                       [{}] * len(fetched)))
+    errors = []
+    failed_fetches = [instance for instance, result in fetches
+                      if result is False]
+    if failed_fetches:
+        errors.append('Failed fetching (not merged): {0}'.format(
+            _repo_names(failed_fetches)))
+    failed_merges = [instance for instance, result in merges
+                     if result is False]
+    if failed_merges:
+        errors.append('Could not fast-forward: {0}'.format(
+            _repo_names(failed_merges)))
+    if errors:
+        raise exceptions.NonRecoverableError('. '.join(errors))
+
+
+def _fetch_all(instances, fetch_kwargs, max_connections_per_host):
+    # a fetch task is only started once its remote host has a free
+    # connection, so pool threads never wait on a busy host
+    hosts = dict(zip([instance.id for instance in instances],
+                     _scan_remote_hosts(instances)))
+    pending = list(instances)
+    running = []
+    results = {}
+    while pending or running:
+        for instance in list(pending):
+            host = hosts[instance.id]
+            if len([i for i, _ in running
+                    if hosts[i.id] == host]) >= max_connections_per_host:
+                continue
+            pending.remove(instance)
+            running.append((instance, instance.execute_operation(
+                'git.fetch', kwargs=fetch_kwargs)))
+        finished = [(instance, result) for instance, result in running
+                    if result.task.is_terminated]
+        if not finished:
+            time.sleep(TASK_POLL_INTERVAL)
+            continue
+        for instance, result in finished:
+            running.remove((instance, result))
+            try:
+                results[instance.id] = result.get()
+            except Exception as e:
+                workflow_ctx.logger.error('{0}: {1}'.format(
+                    _repo_name(instance), e))
+                results[instance.id] = False
+    return [results[instance.id] for instance in instances]
+
+
+def _scan_remote_hosts(instances):
+    if not instances:
+        return []
+
+    def remote_host(instance):
+        properties = instance.node.properties
+        repo_location = (path(properties['location']).expanduser() /
+                         properties['name'])
+        try:
+            # url of the current branch's upstream remote, without network
+            url = sh.git('ls-remote', '--get-url',
+                         _cwd=repo_location).stdout.strip()
+        except (sh.ErrorReturnCode, OSError):
+            return ''
+        return scheduler.remote_host(url)
+    pool = ThreadPool(min(len(instances), SCAN_POOL_SIZE))
+    try:
+        return pool.map(remote_host, instances)
+    finally:
+        pool.close()
+
+
+@workflow
+def git_checkout(branch, **_):
+    instances = [instance for instance in workflow_ctx.node_instances
+                 if instance.node.type == 'git_repo']
+    _checkout_all(instances, branch)
+
+
+@workflow
+def feature_create(name, branch, base=None, **_):
+    # finds the feature repos and checks the new feature out in one go,
+    # the caller stores the feature even if the checkout failed
+    instances = [instance for instance in workflow_ctx.node_instances
+                 if instance.node.type == 'git_repo']
+    repos = sorted(_scan_branch_exists(instances, branch))
+    feature = {'name': name, 'branch': branch, 'repos': repos}
+    if base:
+        feature['base'] = base
+    try:
+        _checkout_all(instances, name, feature)
+    except exceptions.NonRecoverableError as e:
+        return {'repos': repos, 'error': str(e)}
+    return {'repos': repos, 'error': None}
+
+
+@workflow
+def feature_add_repo(repo, branch, base, **_):
+    instance = _repo_instance(repo)
+    graph = workflow_ctx.graph_mode()
+    create_task = instance.execute_operation('git.create_branch', kwargs={
+        'branch': branch,
+        'base': base
+    })
+    checkout_task = instance.execute_operation('git.checkout_branch',
+                                               kwargs={'branch': branch})
+    graph.add_task(create_task)
+    graph.add_task(checkout_task)
+    graph.add_dependency(checkout_task, create_task)
+    graph.execute()
+    if not checkout_task.async_result.get():
+        raise exceptions.NonRecoverableError(
+            'Could not checkout branch {0} in {1}'.format(branch, repo))
+
+
+@workflow
+def feature_finish(branches, force=False, **_):
+    # deletes the feature branches (repo -> branch) concurrently and
+    # returns the repos in which the branch could not be deleted
+    instances = [instance for instance in workflow_ctx.node_instances
+                 if instance.node.type == 'git_repo' and
+                 _repo_name(instance) in branches]
+    results = _execute_all(instances, 'git.delete_branch',
+                           [{'branch': branches[_repo_name(instance)],
+                             'force': force} for instance in instances])
+    return sorted(_repo_name(instance)
+                  for instance, deleted in zip(instances, results)
+                  if not deleted)
+
+
+def _checkout_all(instances, branch, feature=None):
+    preflight = zip(instances, _execute_all(
+        instances, 'git.checkout_preflight',
+        [{'branch': branch, 'feature': feature}] * len(instances)))
+    failed = [instance for instance, result in preflight if result['error']]
+    if failed:
+        raise exceptions.NonRecoverableError(
+            'Checkout preflight failed for: {0}. No repository was '
+            'switched.'.format(_repo_names(failed)))
+    switches = [(instance, result) for instance, result in preflight
+                if result['target']]
+    switched = zip(switches, _execute_all(
+        [instance for instance, result in switches],
+        'git.checkout_branch',
+        [{'branch': result['target']} for instance, result in switches]))
+    failed = [switch[0] for switch, success in switched if not success]
+    if not failed:
+        return
+    rollback = [switch for switch, success in switched if success]
+    _execute_all([instance for instance, result in rollback],
+                 'git.checkout_branch',
+                 [{'branch': result['previous']}
+                  for instance, result in rollback])
+    raise exceptions.NonRecoverableError(
+        'Checkout failed for: {0}. Switched repositories were rolled '
+        'back.'.format(_repo_names(failed)))
+
+
+@workflow
+def feature_hub(operation, operation_kwargs=None, **_):
+    # repos that are not part of the active feature are skipped before
+    # any hub process is started
+    instances = _feature_instances()
+    if not instances:
+        workflow_ctx.logger.info('No repository is part of the active '
+                                 'feature.')
+        return
+    _execute_all(instances, operation,
+                 [operation_kwargs or {}] * len(instances))
+
+
+@workflow
+def git_execute_operation(operation, operation_kwargs=None,
+                          order=OUTPUT_REPO_ORDER, **_):
+    # operations run concurrently while the logs of each repo are kept
+    # by its own task and written in one piece once the task ends
+    if order not in [OUTPUT_REPO_ORDER, OUTPUT_FIRST_FINISHED]:
+        raise exceptions.NonRecoverableError(
+            'Illegal order: {0}'.format(order))
+    kwargs = dict(operation_kwargs or {})
+    kwargs['capture_logs'] = True
+    instances = sorted((instance for instance in workflow_ctx.node_instances
+                        if instance.node.type == 'git_repo'),
+                       key=_repo_name)
+    results = [(instance, instance.execute_operation(
+        operation, kwargs=kwargs, allow_kwargs_override=True))
+        for instance in instances]
+    if order == OUTPUT_FIRST_FINISHED:
+        results = _finished_first(results)
+    failed = []
+    for instance, result in results:
+        try:
+            captured = result.get()['logs']
+        except Exception as e:
+            # logs of failed operations are written when they fail
+            workflow_ctx.logger.error('{0}: {1}'.format(_repo_name(instance),
+                                                        e))
+            failed.append(instance)
+            continue
+        for log in captured:
+            logs.stdout_log_out(log)
+    if failed:
+        raise exceptions.NonRecoverableError(
+            '{0} failed for: {1}'.format(operation, _repo_names(failed)))
+
+
+def _finished_first(results):
+    pending = list(results)
+    while pending:
+        finished = [(instance, result) for instance, result in pending
+                    if result.task.is_terminated]
+        if not finished:
+            time.sleep(TASK_POLL_INTERVAL)
+            continue
+        for instance, result in finished:
+            pending.remove((instance, result))
+            yield instance, result
+
+
+def _feature_instances():
+    instances = [instance for instance in workflow_ctx.node_instances
+                 if instance.node.type == 'git_repo']
+    if not instances:
+        return []
+    payload = filecache.json_files.load(
+        workflow_ctx.internal.handler.storage._payload_path) or {}
+    active_feature = _active_feature(
+        payload, instances[0].node.properties['features_file'])
+    return [instance for instance in instances
+            if active_feature.repo_branch(instance.node.properties['name'])]
+
+
+def _active_feature(payload, features_file):
+    name = payload.get('active_feature')
+    if not name:
+        return Feature({})
+    branches = filecache.yaml_files.load(
+        path(features_file).expanduser()) or {}
+    if not branches:
+        return Feature({})
+    active_feature = Feature(branches.get(name) or {})
+    active_feature.name = name
+    return active_feature
+
+
+def _execute_all(instances, operation, kwargs_list):
+    graph = workflow_ctx.graph_mode()
+    tasks = [instance.execute_operation(operation, kwargs=kwargs)
+             for instance, kwargs in zip(instances, kwargs_list)]
+    for task in tasks:
+        graph.add_task(task)
+    graph.execute()
+    return [task.async_result.get() for task in tasks]
+
+
+def _repo_names(instances):
+    return ', '.join(sorted(_repo_name(instance) for instance in instances))
+
+
+def _scan_branch_exists(instances, branch):
+    if not instances:
+        return []
+
+    def repo_branch_exists(instance):
+        properties = instance.node.properties
+        repo_location = (path(properties['location']).expanduser() /
+                         properties['name'])
+        return _branch_exists(repo_location, branch)
+    pool = ThreadPool(min(len(instances), SCAN_POOL_SIZE))
+    try:
+        results = pool.map(repo_branch_exists, instances)
+    finally:
+        pool.close()
+    return [_repo_name(instance)
+            for instance, exists in zip(instances, results) if exists]
+
+
+def _branch_exists(repo_location, branch, local_only=False):
+    ref_prefixes = ['refs/heads']
+    if not local_only:
+        ref_prefixes.append('refs/remotes/origin')
+    ref_store = refs.get_store(repo_location / '.git')
+    if ref_store.supported:
+        return any(ref_store.exists('{0}/{1}'.format(ref, branch))
+                   for ref in ref_prefixes)
+    branch_exists = sh.git.bake(
+        '--git-dir', repo_location / '.git',
+        '--work-tree', repo_location,
+        'show-ref', verify=True, quiet=True)
+    for ref in ref_prefixes:
+        try:
+            branch_exists('{0}/{1}'.format(ref, branch))
+        except sh.ErrorReturnCode:
+            pass
+        else:
+            return True
+    return False
+
+
+def _repo_name(instance):
+    return instance.node.id[:-len('-repo')]
+
+
+def _repo_instance(repo):
+    node_id = '{0}-repo'.format(repo)
+    for instance in workflow_ctx.node_instances:
+        if instance.node.id == node_id:
+            return instance
+    raise exceptions.NonRecoverableError('No such repo: {0}'.format(repo))
+
+
 class Feature(dict):
 
     def __init__(self, initial):
@@ -488,13 +1187,16 @@ class Feature(dict):
 
     @property
     def branch(self):
+        return self.repo_branch(repo.name)
+
+    def repo_branch(self, name):
         repos = self.repos
         if not repos:
             return None
         elif isinstance(repos, dict):
-            return repos.get(repo.name)
+            return repos.get(name)
         elif isinstance(repos, list):
-            if repo.name in repos:
+            if name in repos:
                 return self.get('branch')
             else:
                 return None
@@ -517,16 +1219,21 @@ class Feature(dict):
 
 def func(repo_method):
     @operation
-    def wrapper(**kwargs):
+    def wrapper(capture_logs=False, **kwargs):
         kwargs.pop('ctx', None)
         try:
             method = getattr(repo, repo_method)
         except AttributeError:
             method = getattr(hub, repo_method)
-        return method(**kwargs)
+        if not capture_logs:
+            return method(**kwargs)
+        with captured_logs(ctx.logger) as captured:
+            result = method(**kwargs)
+        return {'result': result, 'logs': captured}
     return wrapper
 
-for method in ['clone', 'configure', 'pull', 'status', 'checkout', 'reset',
+for method in ['clone', 'configure', 'pull', 'fetch', 'merge', 'status',
+               'checkout', 'checkout_preflight', 'checkout_branch', 'reset',
                'rebase', 'squash', 'diff', 'create_branch', 'branch_exists',
                'delete_branch', 'ci_status', 'compare', 'pull_request']:
     globals()[method] = func(method)
@@ -119,6 +119,7 @@ def configure_virtualenv(
         constraints,
         postactivate_resource_path,
         git_retag_cloudify_resource_path,
+        clue_launcher_resource_path,
         register_python_argcomplete,
         **_):
 
@@ -132,11 +133,15 @@ def configure_virtualenv(
 
     virtualenv_bin = path(virtualenv_location) / 'bin'
 
-    # clue symlink
-    clue_source_path = path(sys.executable).dirname() / 'clue'
+    # clue launcher (replaces the symlink created by previous versions)
     clue_target_path = virtualenv_bin / 'clue'
-    if not clue_target_path.exists():
-        os.symlink(clue_source_path, clue_target_path)
+    if clue_target_path.islink():
+        clue_target_path.remove()
+    ctx.download_resource_and_render(
+        clue_launcher_resource_path,
+        template_variables={'sys_executable': sys.executable},
+        target_path=clue_target_path)
+    os.chmod(clue_target_path, 0755)
 
     # postactivate
     variables = dict(register_python_argcomplete=register_python_argcomplete)
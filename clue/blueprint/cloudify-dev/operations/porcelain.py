@@ -0,0 +1,200 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import colors
+from path import path
+
+# git status --porcelain=v2 requires git >= 2.11 and --show-stash in
+# porcelain v2 output requires git >= 2.35
+PORCELAIN_V2_VERSION = (2, 11)
+SHOW_STASH_VERSION = (2, 35)
+
+
+class BranchState(object):
+
+    def __init__(self):
+        self.oid = None
+        self.head = None
+        self.upstream = None
+        self.ahead = None
+        self.behind = None
+        self.stash = 0
+        self.entries = []
+        self.operation = ''
+
+    @property
+    def detached(self):
+        return self.head == '(detached)'
+
+    @property
+    def initial(self):
+        return self.oid == '(initial)'
+
+    @property
+    def unstaged(self):
+        return any(xy[1] != ' ' for xy, _ in self.entries if xy != '??')
+
+    @property
+    def staged(self):
+        return any(xy[0] != ' ' for xy, _ in self.entries if xy != '??')
+
+    @property
+    def untracked(self):
+        return any(xy == '??' for xy, _ in self.entries)
+
+    @property
+    def dirty(self):
+        return bool(self.entries)
+
+    @property
+    def upstream_indicator(self):
+        if self.ahead is None or self.behind is None:
+            return ''
+        if self.ahead and self.behind:
+            return '<>'
+        elif self.ahead:
+            return '>'
+        elif self.behind:
+            return '<'
+        return '='
+
+    def branch_state(self):
+        # mimics __git_ps1 output with GIT_PS1_SHOWCOLORHINTS,
+        # GIT_PS1_SHOWDIRTYSTATE, GIT_PS1_SHOWSTASHSTATE,
+        # GIT_PS1_SHOWUNTRACKEDFILES and GIT_PS1_SHOWUPSTREAM=auto
+        if self.detached:
+            branch = colors.red('({}...)'.format((self.oid or '')[:7]))
+        else:
+            branch = colors.green(self.head)
+        flags = ''
+        if self.unstaged:
+            flags += colors.red('*')
+        if self.initial:
+            flags += colors.green('#')
+        elif self.staged:
+            flags += colors.green('+')
+        if self.stash:
+            flags += colors.blue('$', style='bold')
+        if self.untracked:
+            flags += colors.red('%')
+        if flags:
+            flags = ' {}'.format(flags)
+        return '{}{}{}{}'.format(branch, flags, self.operation,
+                                 self.upstream_indicator)
+
+    def short_status(self):
+        return ['{} {}'.format(xy, entry_path)
+                for xy, entry_path in self.entries]
+
+
+def parse(output):
+    state = BranchState()
+    for line in output.split('\n'):
+        if not line:
+            continue
+        if line.startswith('# '):
+            key, _, value = line[2:].partition(' ')
+            if key == 'branch.oid':
+                state.oid = value
+            elif key == 'branch.head':
+                state.head = value
+            elif key == 'branch.upstream':
+                state.upstream = value
+            elif key == 'branch.ab':
+                ahead, behind = value.split(' ')
+                state.ahead = abs(int(ahead))
+                state.behind = abs(int(behind))
+            elif key == 'stash':
+                state.stash = int(value)
+            continue
+        kind = line[0]
+        if kind == '1':
+            fields = line.split(' ', 8)
+            state.entries.append((_xy(fields[1]), _quote(fields[8])))
+        elif kind == '2':
+            fields = line.split(' ', 9)
+            new_path, _, orig_path = fields[9].partition('\t')
+            state.entries.append((_xy(fields[1]), '{} -> {}'.format(
+                _quote(orig_path), _quote(new_path))))
+        elif kind == 'u':
+            fields = line.split(' ', 10)
+            state.entries.append((_xy(fields[1]), _quote(fields[10])))
+        elif kind == '?':
+            state.entries.append(('??', _quote(line[2:])))
+    return state
+
+
+def _xy(xy):
+    return xy.replace('.', ' ')
+
+
+def _quote(entry_path):
+    # porcelain v2 already c-quotes paths with special characters, but
+    # unlike short status it leaves paths that only contain spaces as is
+    if ' ' in entry_path and not entry_path.startswith('"'):
+        return '"{}"'.format(entry_path)
+    return entry_path
+
+
+def read_operation(state, git_dir):
+    git_dir = path(git_dir)
+    step = total = head_name = None
+    rebase_merge = git_dir / 'rebase-merge'
+    rebase_apply = git_dir / 'rebase-apply'
+    if rebase_merge.isdir():
+        head_name = _read(rebase_merge / 'head-name')
+        step = _read(rebase_merge / 'msgnum')
+        total = _read(rebase_merge / 'end')
+        if (rebase_merge / 'interactive').exists():
+            operation = '|REBASE-i'
+        else:
+            operation = '|REBASE-m'
+    elif rebase_apply.isdir():
+        head_name = _read(rebase_apply / 'head-name')
+        step = _read(rebase_apply / 'next')
+        total = _read(rebase_apply / 'last')
+        if (rebase_apply / 'rebasing').exists():
+            operation = '|REBASE'
+        elif (rebase_apply / 'applying').exists():
+            operation = '|AM'
+        else:
+            operation = '|AM/REBASE'
+    elif (git_dir / 'MERGE_HEAD').exists():
+        operation = '|MERGING'
+    elif (git_dir / 'CHERRY_PICK_HEAD').exists():
+        operation = '|CHERRY-PICKING'
+    elif (git_dir / 'REVERT_HEAD').exists():
+        operation = '|REVERTING'
+    elif (git_dir / 'BISECT_LOG').exists():
+        operation = '|BISECTING'
+    else:
+        return
+    if step and total:
+        operation = '{} {}/{}'.format(operation, step, total)
+    if head_name and state.detached:
+        state.head = head_name.replace('refs/heads/', '', 1)
+    state.operation = operation
+
+
+def has_stash(git_dir):
+    return (path(git_dir) / 'logs' / 'refs' / 'stash').exists()
+
+
+def _read(file_path):
+    try:
+        return file_path.text().strip()
+    except (IOError, OSError):
+        return None
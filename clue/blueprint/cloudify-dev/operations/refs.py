@@ -0,0 +1,286 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import mmap
+import os
+import string
+import threading
+
+# packed-refs files larger than this are binary searched through a memory
+# map instead of being parsed as a whole
+MMAP_THRESHOLD = 64 * 1024
+
+_SYMREF_PREFIX = 'ref: '
+_MAX_SYMREF_DEPTH = 5
+_PER_WORKTREE_PREFIXES = ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+_HEX_DIGITS = set(string.hexdigits)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(git_dir):
+    git_dir = os.path.abspath(os.path.expanduser(git_dir))
+    with _stores_lock:
+        store = _stores.get(git_dir)
+        if store is None:
+            store = RefStore(git_dir)
+            _stores[git_dir] = store
+        return store
+
+
+def is_object_id(value):
+    return len(value) in (40, 64) and all(c in _HEX_DIGITS for c in value)
+
+
+class RefStore(object):
+
+    def __init__(self, git_dir):
+        if os.path.isfile(git_dir):
+            git_dir = _read_gitdir_file(git_dir)
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        commondir_file = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir_file):
+            with open(commondir_file) as f:
+                common_dir = f.read().strip()
+            self.common_dir = os.path.normpath(
+                os.path.join(git_dir, common_dir))
+        self.packed_refs = PackedRefs(os.path.join(self.common_dir,
+                                                   'packed-refs'))
+        self._loose = {}
+        self._lock = threading.Lock()
+
+    @property
+    def supported(self):
+        return (os.path.isfile(os.path.join(self.git_dir, 'HEAD')) and
+                not os.path.isdir(os.path.join(self.common_dir, 'reftable')))
+
+    def head(self):
+        return self._read_loose('HEAD')
+
+    def current_branch(self):
+        # same semantics as 'git rev-parse --abbrev-ref HEAD'
+        head = self.head()
+        if head and head.startswith(_SYMREF_PREFIX):
+            ref = head[len(_SYMREF_PREFIX):]
+            if ref.startswith('refs/heads/'):
+                return ref[len('refs/heads/'):]
+            return ref
+        return 'HEAD'
+
+    def read_ref(self, name):
+        for _ in range(_MAX_SYMREF_DEPTH):
+            value = self._read_loose(name)
+            if value is None:
+                return self.packed_refs.get(name)
+            if not value.startswith(_SYMREF_PREFIX):
+                return value
+            name = value[len(_SYMREF_PREFIX):]
+        return None
+
+    def exists(self, name):
+        return self.read_ref(name) is not None
+
+    def resolve(self, rev):
+        # same lookup order as git rev-parse for a ref short name
+        if is_object_id(rev):
+            return rev
+        for name in [rev,
+                     'refs/{}'.format(rev),
+                     'refs/tags/{}'.format(rev),
+                     'refs/heads/{}'.format(rev),
+                     'refs/remotes/{}'.format(rev),
+                     'refs/remotes/{}/HEAD'.format(rev)]:
+            object_id = self.read_ref(name)
+            if object_id:
+                return object_id
+        return None
+
+    def peeled(self, name):
+        return self.packed_refs.peeled(name)
+
+    def refs(self, prefix='refs/'):
+        result = dict(self.packed_refs.refs(prefix))
+        base_dir = self._ref_dir(prefix)
+        prefix_dir = os.path.join(base_dir, prefix)
+        for root, _, files in os.walk(prefix_dir):
+            for file_name in files:
+                if file_name.endswith('.lock'):
+                    continue
+                name = os.path.relpath(os.path.join(root, file_name),
+                                       base_dir).replace(os.sep, '/')
+                if not name.startswith(prefix):
+                    continue
+                object_id = self.read_ref(name)
+                if object_id:
+                    result[name] = object_id
+        return result
+
+    def _ref_dir(self, name):
+        if '/' not in name or name.startswith(_PER_WORKTREE_PREFIXES):
+            return self.git_dir
+        return self.common_dir
+
+    def _read_loose(self, name):
+        ref_path = os.path.join(self._ref_dir(name), name)
+        try:
+            stat = os.stat(ref_path)
+        except OSError:
+            return None
+        key = (stat.st_mtime, stat.st_size, stat.st_ino)
+        with self._lock:
+            cached = self._loose.get(ref_path)
+            if cached and cached[0] == key:
+                return cached[1]
+        try:
+            with open(ref_path) as f:
+                value = f.read().strip()
+        except IOError:
+            return None
+        if not value:
+            return None
+        with self._lock:
+            self._loose[ref_path] = (key, value)
+        return value
+
+
+class PackedRefs(object):
+
+    def __init__(self, packed_refs_path):
+        self.path = packed_refs_path
+        self._key = None
+        self._refs = {}
+        self._peeled = {}
+        self._mmap = None
+        self._mmap_start = 0
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            self._reload()
+            if self._mmap is None or name in self._refs:
+                return self._refs.get(name)
+            object_id, peeled = self._bisect(name)
+            if object_id:
+                self._refs[name] = object_id
+                if peeled:
+                    self._peeled[name] = peeled
+            return object_id
+
+    def peeled(self, name):
+        if self.get(name) is None:
+            return None
+        with self._lock:
+            return self._peeled.get(name)
+
+    def refs(self, prefix):
+        with self._lock:
+            self._reload()
+            if self._mmap is not None:
+                refs, _ = _parse(self._mmap[:])
+            else:
+                refs = self._refs
+            return [(name, object_id) for name, object_id in refs.items()
+                    if name.startswith(prefix)]
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._close()
+            self._key = None
+            self._refs = {}
+            self._peeled = {}
+            return
+        key = (stat.st_mtime, stat.st_size, stat.st_ino)
+        if key == self._key:
+            return
+        self._close()
+        self._key = key
+        self._refs = {}
+        self._peeled = {}
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            sorted_refs = (header.startswith('# pack-refs with:') and
+                           ' sorted ' in '{} '.format(header.strip()))
+            if sorted_refs and stat.st_size >= MMAP_THRESHOLD:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mmap_start = len(header)
+            else:
+                f.seek(0)
+                self._refs, self._peeled = _parse(f.read())
+
+    def _bisect(self, name):
+        data = self._mmap
+        size = len(data)
+        lo, hi = self._mmap_start, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = max(data.rfind('\n', lo, mid) + 1, lo)
+            if data[start] == '^':
+                start = max(data.rfind('\n', lo, start - 1) + 1, lo)
+            end = data.find('\n', start)
+            if end == -1:
+                end = size
+            line = data[start:end]
+            refname = line[line.find(' ') + 1:]
+            if refname == name:
+                peeled = None
+                if end + 1 < size and data[end + 1] == '^':
+                    peel_end = data.find('\n', end + 1)
+                    if peel_end == -1:
+                        peel_end = size
+                    peeled = data[end + 2:peel_end].strip()
+                return line[:line.find(' ')], peeled
+            elif refname < name:
+                lo = end + 1
+                if lo < size and data[lo] == '^':
+                    lo = data.find('\n', lo) + 1 or size
+            else:
+                hi = start
+        return None, None
+
+    def _close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def _parse(content):
+    refs = {}
+    peeled = {}
+    last_name = None
+    for line in content.split('\n'):
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('^'):
+            if last_name:
+                peeled[last_name] = line[1:].strip()
+            continue
+        object_id, _, name = line.partition(' ')
+        name = name.strip()
+        refs[name] = object_id
+        last_name = name
+    return refs, peeled
+
+
+def _read_gitdir_file(git_file):
+    with open(git_file) as f:
+        content = f.read().strip()
+    git_dir = content[len('gitdir: '):] if content.startswith(
+        'gitdir: ') else content
+    return os.path.normpath(os.path.join(os.path.dirname(git_file), git_dir))
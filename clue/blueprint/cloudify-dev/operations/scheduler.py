@@ -0,0 +1,66 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import random
+import re
+import threading
+import time
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+_SCP_LIKE_URL = re.compile(r'^(?:[^@/]+@)?([^:/]+):(?!//)')
+_URL = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://(?:[^@/]+@)?([^:/]*)')
+
+
+def remote_host(url):
+    match = _URL.match(url) or _SCP_LIKE_URL.match(url)
+    return match.group(1).lower() if match else ''
+
+
+def host_semaphore(host, limit):
+    # one semaphore per remote host, shared by all operations running in
+    # the workflow process
+    key = (host, limit)
+    with _semaphores_lock:
+        semaphore = _semaphores.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max(limit, 1))
+            _semaphores[key] = semaphore
+        return semaphore
+
+
+def backoff_delay(attempt, interval, max_interval):
+    delay = min(max_interval, interval * (2 ** attempt))
+    return random.uniform(delay / 2.0, delay)
+
+
+def run_with_backoff(func, host, limit, retries, interval, max_interval,
+                     retry_on, on_retry=None):
+    attempt = 0
+    while True:
+        with host_semaphore(host, limit):
+            try:
+                return func()
+            except retry_on as e:
+                if attempt >= retries:
+                    raise
+                error = e
+        delay = backoff_delay(attempt, interval, max_interval)
+        if on_retry:
+            on_retry(attempt + 1, delay, error)
+        time.sleep(delay)
+        attempt += 1
@@ -0,0 +1,94 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import json
+import threading
+
+import sh
+import yaml
+from path import path
+
+import catfile
+import refs
+from common import atomic_write
+
+_manifests = {}
+_locks = {}
+_lock = threading.Lock()
+
+
+def components(versions_repo_location, versions_branch, cache_dir):
+    versions_repo_location = path(versions_repo_location)
+    error = None
+    for rev in [versions_branch, 'origin/{}'.format(versions_branch)]:
+        object_id = _resolve(versions_repo_location, rev)
+        if not object_id:
+            continue
+        try:
+            return _load(versions_repo_location, object_id, path(cache_dir))
+        except sh.ErrorReturnCode as e:
+            error = e
+    if error:
+        raise error
+    # let git produce the error for revisions that cannot be resolved
+    return _read(versions_repo_location, versions_branch)
+
+
+def _resolve(versions_repo_location, rev):
+    git_dir = versions_repo_location / '.git'
+    ref_store = refs.get_store(git_dir)
+    if ref_store.supported:
+        return ref_store.resolve(rev)
+    return catfile.get_reader(git_dir).resolve(rev)
+
+
+def _load(versions_repo_location, object_id, cache_dir):
+    with _key_lock(object_id):
+        if object_id in _manifests:
+            return _manifests[object_id]
+        cache_file = cache_dir / '{}.json'.format(object_id)
+        if cache_file.exists():
+            result = json.loads(cache_file.text())
+        else:
+            result = _read(versions_repo_location, object_id)
+            atomic_write(cache_file, json.dumps(result))
+        _manifests[object_id] = result
+        return result
+
+
+def _read(versions_repo_location, rev):
+    versions_file = '{}:versions.yaml'.format(rev)
+    git_object = catfile.get_reader(versions_repo_location / '.git').read(
+        versions_file)
+    if git_object:
+        raw_versions = git_object.content
+    else:
+        # let git produce the error
+        raw_versions = _git(versions_repo_location).show(
+            versions_file).stdout
+    versions = yaml.safe_load(raw_versions) or {}
+    return versions.get('components', {})
+
+
+def _key_lock(key):
+    with _lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _git(repo_location):
+    return sh.git.bake('--no-pager',
+                       '--git-dir', repo_location / '.git',
+                       '--work-tree', repo_location)
@@ -15,73 +15,363 @@
 ############
 
 
+import bisect
+import json
+import os
+
+from clue import config
+
+INDEX_FILE = 'completion-index.json'
+BRANCHES_INDEX_FILE = 'branches-index.json'
+
+# completers that are answered from the completion index by the fast path,
+# mapped to the index entry they complete from
+INDEXED_COMPLETERS = {
+    'clue.completion:package_completer': 'packages',
+    'clue.completion:repo_completer': 'repos',
+    'clue.completion:features_completer': 'features',
+    'clue.completion:active_feature_repo_completer': 'active_feature_repos',
+    'clue.completion:branches_completer': 'branches'
+}
+VERSIONS_PREFIX = '::'
+REF_PREFIXES = ('refs/heads/', 'refs/remotes/', 'refs/tags/')
+_SPECIAL_CHARS = '\\();<>|&!`$* \t\n"\''
+_CONTINUATION_CHARS = '=/:'
+
+
 def package_completer(env, prefix, **_):
-    nodes = env.storage.get_nodes()
-    suffix_len = len('-package')
-    return (n.id[:-suffix_len] for n in nodes
-            if n.type == 'python_package' and
-            n.id.startswith(prefix))
+    return _complete(env, 'packages', prefix)
 
 
 def repo_completer(env, prefix, **_):
-    nodes = env.storage.get_nodes()
-    suffix_len = len('-repo')
-    return (n.id[:-suffix_len] for n in nodes
-            if n.type == 'git_repo' and
-            n.id.startswith(prefix))
+    return _complete(env, 'repos', prefix)
 
 
 def active_feature_repo_completer(env, prefix, **_):
-    import json
-    with open(env.storage._payload_path) as f:
-        active_feature = json.load(f).get('active_feature')
-    if not active_feature:
-        return []
-    features = _load_features_file(env)
-    active_feature = features.get(active_feature)
-    if not active_feature:
-        return []
-    repos = active_feature.get('repos', [])
-    return (repo for repo in repo_completer(env, prefix)
-            if repo in repos)
+    return _complete(env, 'active_feature_repos', prefix)
 
 
 def features_completer(env, prefix, **_):
-    features = _load_features_file(env)
-    return [k for k in features if k.startswith(prefix)]
+    return _complete(env, 'features', prefix)
 
 
 def branches_completer(env, prefix, **_):
-    versions_prefix = '::'
-    if prefix.startswith(versions_prefix):
-        from path import path
-        from sh import git
-        import json
-        with open(env.storage._payload_path) as f:
-            versions_repo_location = path(
-                json.load(f)['versions_repo_location'])
-        with versions_repo_location:
-            result = git('show-ref').stdout.split('\n')
-            result = ['{}{}'.format(versions_prefix,
-                                    r.strip().rsplit('/', 1)[-1])
-                      for r in result]
-            return [r for r in result if r.startswith(prefix)]
-    else:
-        result = []
-        if 'default'.startswith(prefix):
-            result.append('default')
-        return result
+    index_path = os.path.join(env.storage._storage_dir, BRANCHES_INDEX_FILE)
+    return _branch_completions(update_branches_index(env, index_path),
+                               prefix)
 
 
-def _load_features_file(env):
+def write_index(env):
+    storage = env.storage
     features_file = env.plan['inputs'].get('features_file')
+    if features_file:
+        # the index is validated from other working directories
+        features_file = os.path.abspath(os.path.expanduser(features_file))
+    # stat the sources before reading them so a concurrent change leaves
+    # the index stale rather than silently outdated
+    sources = dict((source, _stat_key(source))
+                   for source in [storage._payload_path, features_file]
+                   if source)
+    with open(storage._payload_path) as f:
+        active_feature = json.load(f).get('active_feature')
+    features = _features_store(env)
+    all_features = features.load() if features else {}
+    nodes = storage.get_nodes()
+    repos = sorted(n.id[:-len('-repo')] for n in nodes
+                   if n.type == 'git_repo')
+    packages = sorted(n.id[:-len('-package')] for n in nodes
+                      if n.type == 'python_package')
+    active_feature_repos = []
+    if active_feature in all_features:
+        feature_repos = all_features[active_feature].get('repos') or []
+        active_feature_repos = [r for r in repos if r in feature_repos]
+    index = {
+        'sources': sources,
+        'repos': repos,
+        'packages': packages,
+        'features': sorted(all_features),
+        'active_feature': active_feature,
+        'active_feature_repos': active_feature_repos
+    }
+    from clue import store
+    store.atomic_write(os.path.join(storage._storage_dir, INDEX_FILE),
+                       json.dumps(index))
+    return index
+
+
+def update_branches_index(env, index_path=None):
+    """Refresh the refs of repos that changed since the index was written.
+
+    Refs are listed from packed-refs and the loose refs directories, and only
+    re-read for repos whose packed-refs or refs directories mtime changed."""
+    index_path = index_path or os.path.join(env.storage._storage_dir,
+                                            BRANCHES_INDEX_FILE)
+    index = _read_json(index_path) or {}
+    with open(env.storage._payload_path) as f:
+        versions_repo = json.load(f).get('versions_repo_location')
+    git_dirs = set()
+    for node in env.storage.get_nodes():
+        if node.type != 'git_repo':
+            continue
+        git_dirs.add(os.path.join(
+            os.path.expanduser(node.properties['location']),
+            node.properties['name'], '.git'))
+    versions_git_dir = None
+    if versions_repo:
+        versions_git_dir = os.path.join(versions_repo, '.git')
+        git_dirs.add(versions_git_dir)
+    previous = index.get('repos', {})
+    repos = {}
+    for git_dir in git_dirs:
+        if not os.path.isdir(git_dir):
+            continue
+        key = _refs_key(git_dir)
+        entry = previous.get(git_dir)
+        if not entry or entry['key'] != key:
+            entry = {'key': key, 'refs': _ref_names(git_dir)}
+        repos[git_dir] = entry
+    if (repos == previous and
+            index.get('versions_repo') == versions_git_dir):
+        return index
+    branches = set()
+    for entry in repos.values():
+        for ref in entry['refs']:
+            if ref.startswith('refs/heads/'):
+                branches.add(ref[len('refs/heads/'):])
+            elif ref.startswith('refs/remotes/'):
+                branch = ref[len('refs/remotes/'):].partition('/')[2]
+                if branch and branch != 'HEAD':
+                    branches.add(branch)
+    versions = set()
+    if versions_git_dir in repos:
+        versions = set(ref.rsplit('/', 1)[-1]
+                       for ref in repos[versions_git_dir]['refs'])
+    index = {
+        'repos': repos,
+        'versions_repo': versions_git_dir,
+        'branches': sorted(branches),
+        'versions': sorted(versions)
+    }
+    from clue import store
+    store.atomic_write(index_path, json.dumps(index))
+    return index
+
+
+def load_branches_index(index_path):
+    index = _read_json(index_path)
+    if index is None:
+        return None
+    for git_dir, entry in index.get('repos', {}).items():
+        if _refs_key(git_dir) != entry['key']:
+            return None
+    return index
+
+
+def load_index(index_path):
+    index = _read_json(index_path)
+    if index is None:
+        return None
+    for source, key in index.get('sources', {}).items():
+        if _stat_key(source) != key:
+            return None
+    return index
+
+
+def fast_complete(config_path):
+    """Answer the current completion request from the completion index.
+
+    Returns without writing anything when the index can't answer it, so the
+    caller falls back to the regular argcomplete path."""
+    try:
+        completions = _fast_completions(config_path)
+    except Exception:
+        completions = None
+    if completions is None:
+        return
+    ifs = os.environ.get('_ARGCOMPLETE_IFS', '\013')
+    output = ifs.join(completions).encode('utf-8')
+    filename = os.environ.get('_ARGCOMPLETE_STDOUT_FILENAME')
+    if filename:
+        with open(filename, 'wb') as f:
+            f.write(output)
+    else:
+        with os.fdopen(8, 'wb') as f:
+            f.write(output)
+    os._exit(0)
+
+
+def _fast_completions(config_path):
+    if (os.environ.get('_ARGCOMPLETE_DFS') or
+            os.environ.get('_ARGCOMPLETE_SHELL') in ('tcsh', 'fish')):
+        return None
+    line = os.environ['COMP_LINE'][:int(os.environ['COMP_POINT'])]
+    # quoting and --option=value are left to argcomplete
+    if any(c in line for c in '\'"\\='):
+        return None
+    words = line.split()
+    prefix = '' if not words or line[-1].isspace() else words.pop()
+    wordbreaks = os.environ.get('_ARGCOMPLETE_COMP_WORDBREAKS', '')
+    last_wordbreak_pos = max([prefix.rfind(c) for c in wordbreaks] or [-1])
+    words = words[int(os.environ['_ARGCOMPLETE']):]
+
+    clash_config = config.load(config_path)
+    command = clash_config['commands']
+    while 'workflow' not in command and 'function' not in command:
+        if not words or words[0] not in command:
+            return None
+        command = command[words.pop(0)]
+
+    options = {}
+    positionals = []
+    for arg in command.get('args', []):
+        names = arg['name'] if isinstance(arg['name'], list) else [
+            arg['name']]
+        if names[0].startswith('-'):
+            options.update((name, arg) for name in names)
+        else:
+            positionals.append(arg)
+    flags = ['-h', '--help']
+    if 'workflow' in command:
+        flags += ['-v', '--verbose']
+    target = None
+    position = 0
+    for word in words:
+        if target is not None:
+            target = None
+        elif word in flags:
+            continue
+        elif word.startswith('-'):
+            if word not in options:
+                return None
+            arg = options[word]
+            if not isinstance(arg.get('default'), bool):
+                target = arg
+        else:
+            position += 1
+    greedy = target is not None
+    if not greedy:
+        if prefix.startswith('-') or position >= len(positionals):
+            return None
+        target = positionals[position]
+    key = INDEXED_COMPLETERS.get(target.get('completer'))
+    if not key:
+        return None
+
+    env_dir = config.env_dir(clash_config)
+    if not env_dir:
+        return None
+    if key == 'branches':
+        index = load_branches_index(os.path.join(env_dir,
+                                                 BRANCHES_INDEX_FILE))
+        if index is None:
+            return None
+        completions = _branch_completions(index, prefix)
+    else:
+        index = load_index(os.path.join(env_dir, INDEX_FILE))
+        if index is None:
+            return None
+        completions = [c for c in index[key] if c.startswith(prefix)]
+    if not greedy:
+        completions += [o for o in sorted(options) + flags
+                        if o.startswith(prefix)]
+    if last_wordbreak_pos >= 0:
+        completions = [c[last_wordbreak_pos + 1:] for c in completions]
+    for char in _SPECIAL_CHARS:
+        completions = [c.replace(char, '\\' + char) for c in completions]
+    if (len(completions) == 1 and
+            completions[0][-1] not in _CONTINUATION_CHARS and
+            os.environ.get('_ARGCOMPLETE_SUPPRESS_SPACE') != '1'):
+        completions[0] += ' '
+    return completions
+
+
+def _complete(env, key, prefix):
+    index = load_index(os.path.join(env.storage._storage_dir, INDEX_FILE))
+    if index is None:
+        index = write_index(env)
+    return [c for c in index[key] if c.startswith(prefix)]
+
+
+def _branch_completions(index, prefix):
+    if prefix.startswith(VERSIONS_PREFIX):
+        return ['{}{}'.format(VERSIONS_PREFIX, name) for name in
+                _prefixed(index.get('versions', []),
+                          prefix[len(VERSIONS_PREFIX):])]
+    result = _prefixed(index.get('branches', []), prefix)
+    if 'default'.startswith(prefix) and 'default' not in result:
+        result.insert(0, 'default')
+    return result
+
+
+def _prefixed(sorted_names, prefix):
+    result = []
+    for i in range(bisect.bisect_left(sorted_names, prefix),
+                   len(sorted_names)):
+        if not sorted_names[i].startswith(prefix):
+            break
+        result.append(sorted_names[i])
+    return result
+
+
+def _ref_names(git_dir):
+    names = set()
+    try:
+        with open(os.path.join(git_dir, 'packed-refs')) as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                name = line.strip().partition(' ')[2]
+                if name.startswith(REF_PREFIXES):
+                    names.add(name)
+    except IOError:
+        pass
+    for prefix in REF_PREFIXES:
+        for root, _, files in os.walk(os.path.join(git_dir, prefix)):
+            for file_name in files:
+                if file_name.endswith('.lock'):
+                    continue
+                names.add(os.path.relpath(os.path.join(root, file_name),
+                                          git_dir).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def _refs_key(git_dir):
+    # git replaces refs by renaming lock files, so any ref creation, update
+    # or removal changes the mtime of the directory holding it
+    latest = None
+    for prefix in REF_PREFIXES:
+        for root, _, _ in os.walk(os.path.join(git_dir, prefix)):
+            latest = max(latest, _mtime(root))
+    return [_mtime(os.path.join(git_dir, 'packed-refs')), latest]
+
+
+def _mtime(file_path):
+    try:
+        return os.stat(file_path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_json(file_path):
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _stat_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size, stat.st_ino]
+
+
+def _features_store(env):
+    inputs = env.plan['inputs']
+    features_file = inputs.get('features_file')
     if not features_file:
-        return []
-    import os
-    features_file = os.path.expanduser(features_file)
-    if not os.path.exists(features_file):
-        return []
-    import yaml
-    with open(features_file) as f:
-        features = yaml.safe_load(f) or {}
-    return features
+        return None
+    from clue import store
+    return store.get_store(features_file, inputs.get('features_store'))
@@ -0,0 +1,76 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import os
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'blueprint',
+                           'clash.yaml')
+# clash keeps the local environment of the configured storage dir here
+ENV_DIR = '.local'
+# the user_config_path of clash.yaml, for commands answered before it is
+# parsed
+USER_CONFIG_PATH_ENV = 'CLUE_CONFIG_PATH'
+DEFAULT_USER_CONFIG_PATH = '~/.clue'
+# the clue server serves the current env of a user config. its socket is
+# found without parsing any configuration, so commands only pay for that
+# when a server is running
+SERVER_SOCKET_ENV = 'CLUE_SERVER_SOCKET'
+SERVER_SOCKET_SUFFIX = '-server.sock'
+
+
+def load(file_path):
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(file_path) as f:
+        return yaml.load(f, Loader=loader)
+
+
+def user_config_path(config):
+    result = config['user_config_path']
+    if isinstance(result, dict):
+        result = os.environ.get(*result['env'])
+    return os.path.expanduser(result)
+
+
+def default_user_config_path():
+    return os.path.expanduser(os.environ.get(USER_CONFIG_PATH_ENV,
+                                             DEFAULT_USER_CONFIG_PATH))
+
+
+def server_socket_path():
+    socket_path = os.environ.get(SERVER_SOCKET_ENV)
+    if socket_path:
+        return os.path.expanduser(socket_path)
+    return default_user_config_path() + SERVER_SOCKET_SUFFIX
+
+
+def env_dir(config=None):
+    """The local environment dir of the current env, found without
+    importing clash. Without a clash config, the default user config path
+    is used."""
+    if config is None:
+        config_path = default_user_config_path()
+    else:
+        config_path = user_config_path(config)
+    if not os.path.isfile(config_path):
+        return None
+    user_config = load(config_path) or {}
+    storage_dir = user_config.get('configurations', {}).get(
+        user_config.get('current'), {}).get('storage_dir')
+    if not storage_dir:
+        return None
+    return os.path.join(storage_dir, ENV_DIR)
@@ -16,6 +16,8 @@
 
 import argparse
 import json
+import os
+import subprocess
 from contextlib import contextmanager
 
 import argh
@@ -25,9 +27,20 @@ from path import path
 
 from clash import ctx
 
+from clue import completion
+from clue import store
 
-def ls():
+STATUS_POOL_SIZE = 10
+STATUS_CACHE_FILE = 'feature-status-cache.json'
+STATUS_CACHE_MAX_SIZE = 1000
+VERSIONS_PREFIX = '::'
+
+
+def ls(status):
     active_feature = features.active_feature
+    if status:
+        _print_status_table(features.load(), active_feature)
+        return
     for name, feature in features.load().items():
         _print_feature(name, feature, active_feature)
 
@@ -57,20 +70,232 @@ def _print_feature(name, feature, active_feature):
     print
 
 
+def _print_status_table(all_features, active_feature):
+    rows = []
+    for name, feature in sorted(all_features.items()):
+        base = feature.get('base', 'master')
+        repos = feature.get('repos') or []
+        if isinstance(repos, dict):
+            branches = sorted(repos.items())
+        else:
+            branches = [(repo, feature.get('branch')) for repo in repos]
+        for repo, branch in branches:
+            rows.append((name, repo, branch, base))
+    if not rows:
+        return
+    statuses = _repos_status(rows)
+    header = ('', 'FEATURE', 'REPO', 'BRANCH', 'AHEAD', 'BEHIND', 'STATUS')
+    table = [header]
+    previous_name = None
+    for row, (ahead, behind, state) in zip(rows, statuses):
+        name, repo, branch, _ = row
+        indicator = '*' if name == active_feature else ''
+        if name == previous_name:
+            indicator = name = ''
+        else:
+            previous_name = name
+        table.append((indicator, name, repo, branch,
+                      '' if ahead is None else str(ahead),
+                      '' if behind is None else str(behind),
+                      state))
+    widths = [max(len(row[i]) for row in table) for i in range(len(header))]
+    row_colors = [colors.red, colors.magenta, colors.green, colors.green,
+                  str, str, colors.yellow]
+    for i, row in enumerate(table):
+        cells = [cell.ljust(width) for cell, width in zip(row, widths)]
+        if i > 0:
+            cells = [color(cell) if cell.strip() else cell
+                     for color, cell in zip(row_colors, cells)]
+        print ' '.join(cells).rstrip()
+
+
+def _repos_status(rows):
+    # ahead/behind counts only depend on the branch and base tips, so
+    # they are cached by that pair of commits
+    from multiprocessing.pool import ThreadPool
+    from clue.git import git_repos
+    locations = dict(git_repos())
+    repo_properties = dict((node.properties['name'], node.properties)
+                           for node in ctx.env.storage.get_nodes()
+                           if node.type == 'git_repo')
+    versions_locations = [location for _, location
+                          in git_repos(repo_type='versions')]
+    versions_components = {}
+    cache_path = path(ctx.env.storage._storage_dir) / STATUS_CACHE_FILE
+    try:
+        cache = json.loads(cache_path.text())
+    except (IOError, OSError, ValueError):
+        cache = {}
+    used = {}
+    repo_rows = {}
+    for index, (_, repo, branch, base) in enumerate(rows):
+        repo_rows.setdefault(repo, []).append((index, branch, base))
+
+    def components(versions_branch):
+        if versions_branch not in versions_components:
+            versions_components[versions_branch] = _versions_components(
+                versions_locations, versions_branch)
+        return versions_components[versions_branch]
+
+    def repo_status(repo):
+        repo_location = locations.get(repo)
+        if not repo_location:
+            return [(index, (None, None, 'missing repo'))
+                    for index, _, _ in repo_rows[repo]]
+        try:
+            return compare(repo, _git_runner(repo_location))
+        except subprocess.CalledProcessError as e:
+            error = (e.output or '').strip().split('\n')[0] or \
+                'git exited with code {0}'.format(e.returncode)
+        except OSError as e:
+            error = e.strerror
+        # a failing repo gets an error cell instead of failing the table
+        return [(index, (None, None, 'error: {0}'.format(error)))
+                for index, _, _ in repo_rows[repo]]
+
+    def compare(repo, git):
+        properties = repo_properties.get(repo, {})
+        # bases are resolved per repo, the same way checkout resolves them
+        branches = [(index, branch,
+                     _resolve_base(base, repo, properties, components))
+                    for index, branch, base in repo_rows[repo]]
+        names = set()
+        for _, branch, base in branches:
+            names.update(name for name in [branch, base] if name)
+        tips = _ref_tips(git, names)
+        dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+        results = []
+        for index, branch, base in branches:
+            branch_tip = tips.get(branch)
+            base_tip = tips.get(base)
+            if not branch_tip or not base_tip:
+                state = 'no branch' if not branch_tip else 'no base'
+                results.append((index, (None, None, state)))
+                continue
+            key = '{0}...{1}'.format(branch_tip, base_tip)
+            counts = cache.get(key)
+            if counts is None:
+                counts = [int(count) for count in git(
+                    'rev-list', '--left-right', '--count', key).split()]
+            used[key] = counts
+            ahead, behind = counts
+            states = []
+            if ahead == 0:
+                states.append('merged')
+            if dirty:
+                states.append('dirty')
+            results.append((index, (ahead, behind, ', '.join(states))))
+        return results
+    pool = ThreadPool(min(len(repo_rows), STATUS_POOL_SIZE))
+    try:
+        results = pool.map(repo_status, sorted(repo_rows))
+    finally:
+        pool.close()
+    statuses = [None] * len(rows)
+    for repo_results in results:
+        for index, status in repo_results:
+            statuses[index] = status
+    if any(key not in cache for key in used):
+        if len(cache) + len(used) > STATUS_CACHE_MAX_SIZE:
+            cache = {}
+        cache.update(used)
+        store.atomic_write(cache_path, json.dumps(cache))
+    return statuses
+
+
+def _resolve_base(base, repo, properties, components):
+    # mirrors the branch resolution of 'git checkout' in the operations
+    repo_type = properties.get('repo_type')
+    if base.startswith(VERSIONS_PREFIX):
+        versions_branch = base[len(VERSIONS_PREFIX):]
+        repo_components = components(versions_branch)
+        if repo in repo_components:
+            return repo_components[repo]
+        elif repo_type in ['core', 'versions']:
+            return versions_branch
+        return properties.get('branch', 'master')
+    elif base.startswith('.') and repo_type in ['core', 'plugin']:
+        template = '3{}' if repo_type == 'core' else '1{}'
+        return template.format(base)
+    return base
+
+
+def _versions_components(versions_locations, versions_branch):
+    if not versions_locations:
+        return {}
+    git = _git_runner(versions_locations[0])
+    for rev in [versions_branch, 'origin/{0}'.format(versions_branch)]:
+        try:
+            git('rev-parse', '--verify', '--quiet',
+                '{0}^{{commit}}'.format(rev))
+            break
+        except subprocess.CalledProcessError:
+            pass
+    else:
+        # let git produce the error for revisions that cannot be resolved
+        rev = versions_branch
+    versions = yaml.safe_load(
+        git('show', '{0}:versions.yaml'.format(rev))) or {}
+    return versions.get('components', {})
+
+
+def _git_runner(repo_location):
+    env = os.environ.copy()
+    # reading the status should not refresh the index
+    env['GIT_OPTIONAL_LOCKS'] = '0'
+
+    def git(*args):
+        command = ['git', '--git-dir', repo_location / '.git',
+                   '--work-tree', repo_location] + list(args)
+        process = subprocess.Popen(command, env=env, cwd=repo_location,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        output, error = process.communicate()
+        if process.returncode:
+            # the error is shown in the status table instead of the terminal
+            raise subprocess.CalledProcessError(process.returncode, command,
+                                                output=error)
+        return output
+    return git
+
+
+def _ref_tips(git, names):
+    # local branches take precedence over origin's
+    refs = {}
+    for name in names:
+        refs['refs/remotes/origin/{0}'.format(name)] = name
+        refs['refs/heads/{0}'.format(name)] = name
+    output = git('for-each-ref', '--format=%(refname) %(objectname)',
+                 *sorted(refs))
+    tips = {}
+    for line in output.splitlines():
+        ref, object_id = line.split(' ')
+        # patterns also match refs nested under the requested names
+        if ref not in refs:
+            continue
+        if ref.startswith('refs/heads/') or refs[ref] not in tips:
+            tips[refs[ref]] = object_id
+    return tips
+
+
 def create(name, branch, base):
-    git_branch_exists = _command(workflow='check_branch_exists',
-                                 parameters={'branch': branch})
-    repos = sorted(_call(git_branch_exists))
+    feature_create = _command(workflow='feature_create',
+                              parameters={'name': name,
+                                          'branch': branch,
+                                          'base': base or ''},
+                              event_cls='clue.output:NamedNodeEvent')
+    result = _call(feature_create)
     with features.update_feature(name) as feature:
         feature.update({
             'branch': branch,
-            'repos': repos
+            'repos': result['repos']
         })
         if base:
             feature['base'] = base
     features.active_feature = name
     _print_feature(name, feature, active_feature=name)
-    checkout(name)
+    if result['error']:
+        raise argh.CommandError(result['error'])
 
 
 def sync_repos(feature_name):
@@ -79,7 +304,7 @@ def sync_repos(feature_name):
         raise argh.CommandError('No feature is currently active.')
     if not features.exists(feature_name):
         raise argh.CommandError('No such feature: {}'.format(feature_name))
-    branch = features.load()[feature_name]['branch']
+    branch = features.get(feature_name)['branch']
     git_branch_exists = _command(workflow='check_branch_exists',
                                  parameters={'branch': branch})
     repos = sorted(_call(git_branch_exists))
@@ -95,12 +320,19 @@ def finish(feature_name):
         raise argh.CommandError('No feature is currently active.')
     if not features.exists(feature_name):
         raise argh.CommandError('No such feature: {}'.format(feature_name))
-    repos = features.load()[feature_name].get('repos', [])
-    for repo in repos:
-        try:
-            remove_repo(repo, feature_name, force=False)
-        except RuntimeError as e:
-            print str(e), 'Skipping.'
+    feature = features.get(feature_name)
+    repos = feature.get('repos') or []
+    if isinstance(repos, dict):
+        branches = repos
+    else:
+        branches = dict((repo, feature['branch']) for repo in repos)
+    feature_finish = _command(workflow='feature_finish',
+                              parameters={'branches': branches,
+                                          'force': False},
+                              event_cls='clue.output:NamedNodeEvent')
+    for repo in _call(feature_finish):
+        print 'Could not delete the feature branch of {}. Skipping.'.format(
+            repo)
     with features.update() as _features:
         _features.pop(feature_name, None)
     features.active_feature = None
@@ -112,7 +344,7 @@ def deactivate():
 
 
 def checkout(name):
-    feature = features.load().get(name)
+    feature = features.get(name)
     if feature:
         features.active_feature = name
     else:
@@ -133,13 +365,11 @@ def add_repo(repo, feature_name):
         if repo not in repos:
             repos.append(repo)
         feature['repos'] = repos
-    _call(_git_command(operation='git.create_branch',
-                       repo=repo,
-                       branch=branch,
-                       base=base))
-    _call(_git_command(operation='git.checkout',
-                       repo=repo,
-                       branch=feature_name))
+    _call(_command(workflow='feature_add_repo',
+                   parameters={'repo': repo,
+                               'branch': branch,
+                               'base': base},
+                   event_cls='clue.output:NamedNodeEvent'))
 
 
 def remove_repo(repo, feature_name, force):
@@ -148,7 +378,7 @@ def remove_repo(repo, feature_name, force):
         raise argh.CommandError('No feature is currently active.')
     if not features.exists(feature_name):
         raise argh.CommandError('No such feature: {}'.format(feature_name))
-    branch = features.load()[feature_name]['branch']
+    branch = features.get(feature_name)['branch']
     _call(_git_command(operation='git.delete_branch',
                        repo=repo,
                        branch=branch,
@@ -166,22 +396,32 @@ class Features(object):
     def path(self):
         return path(ctx.user_config.inputs['features_file'])
 
+    @property
+    def store(self):
+        return store.get_store(self.path,
+                               ctx.user_config.inputs.get('features_store'))
+
     def load(self):
-        if not self.path.exists():
-            return {}
-        return yaml.safe_load(self.path.text()) or {}
+        return self.store.load()
+
+    def get(self, name):
+        return self.store.get(name)
+
+    def names(self):
+        return self.store.names()
 
     def save(self, value):
-        self.path.write_text(yaml.safe_dump(value, default_flow_style=False))
+        self.store.save(value)
+        completion.write_index(ctx.env)
 
     @contextmanager
     def update(self):
-        content = self.load()
-        yield content
-        self.save(content)
+        with self.store.transaction() as content:
+            yield content
+        completion.write_index(ctx.env)
 
     def exists(self, name):
-        return name in self.load()
+        return self.store.exists(name)
 
     @contextmanager
     def update_feature(self, name):
@@ -199,6 +439,7 @@ class Features(object):
     def active_feature(self, value):
         with ctx.env.storage.payload() as payload:
             payload['active_feature'] = value
+        completion.write_index(ctx.env)
 features = Features()
 
 
@@ -0,0 +1,250 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import Queue
+import errno
+import heapq
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import argh
+import colors
+from path import path
+
+from clash import ctx
+
+from clue.feature import features
+
+LOG_FORMAT = '%ct%x00%h%x00%an%x00%s'
+GREP_POOL_SIZE = 10
+GREP_QUEUE_SIZE = 1000
+
+
+def log(since, author, active, max_count):
+    max_count = int(max_count or 0)
+    args = []
+    if since:
+        args.append('--since={0}'.format(since))
+    if author:
+        args.append('--author={0}'.format(author))
+    if max_count:
+        args.append('--max-count={0}'.format(max_count))
+    repos = git_repos(active)
+    if not repos:
+        return
+    formatting = _name_formatting(repos)
+    producers = [LogProducer(name, repo_location, args)
+                 for name, repo_location in repos]
+    try:
+        # each producer yields its commits newest first, so merging them
+        # by negated commit date yields a single newest first timeline
+        # while holding no more than one pending commit per repo
+        for count, entry in enumerate(heapq.merge(*producers), start=1):
+            timestamp, name, sha, author_name, subject = entry
+            date = time.strftime('%Y-%m-%d %H:%M', time.localtime(-timestamp))
+            try:
+                print ' {0}| {1} {2} {3} {4}'.format(
+                    colors.green(formatting.format(name)),
+                    date,
+                    colors.yellow(sha),
+                    colors.blue(author_name),
+                    subject)
+            except IOError as e:
+                if e.errno == errno.EPIPE:
+                    break
+                raise
+            if count == max_count:
+                break
+    finally:
+        for producer in producers:
+            producer.close()
+
+
+class LogProducer(object):
+
+    def __init__(self, name, repo_location, args):
+        self.name = name
+        with open(os.devnull, 'w') as devnull:
+            self._process = subprocess.Popen(
+                ['git', '--no-pager',
+                 '--git-dir', repo_location / '.git',
+                 'log', '--format={0}'.format(LOG_FORMAT)] + args,
+                stdout=subprocess.PIPE,
+                stderr=devnull)
+
+    def __iter__(self):
+        # readline instead of file iteration, which reads ahead in
+        # large chunks before yielding the first line
+        for line in iter(self._process.stdout.readline, ''):
+            timestamp, sha, author_name, subject = line.rstrip('\n').split(
+                '\0', 3)
+            yield -int(timestamp), self.name, sha, author_name, subject
+        self._process.wait()
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        self._process.wait()
+
+
+def grep(pattern, active, type, max_results):
+    max_results = int(max_results or 0)
+    repos = git_repos(active, repo_type=type)
+    if not repos:
+        return
+    formatting = _name_formatting(repos)
+    search = GrepSearch(pattern, repos)
+    failed = []
+    count = 0
+    try:
+        for name, line, error in search.run(GREP_POOL_SIZE):
+            prefix = colors.green(formatting.format(name))
+            if error is not None:
+                failed.append(name)
+                print ' {0}| {1}'.format(prefix, colors.red(error))
+                continue
+            try:
+                print ' {0}| {1}'.format(prefix, line)
+            except IOError as e:
+                if e.errno == errno.EPIPE:
+                    break
+                raise
+            count += 1
+            if count == max_results:
+                break
+    finally:
+        search.cancel()
+    if failed:
+        raise argh.CommandError('git grep failed for: {0}'.format(
+            ', '.join(sorted(failed))))
+
+
+class GrepSearch(object):
+
+    def __init__(self, pattern, repos):
+        self.pattern = pattern
+        self._pending = Queue.Queue()
+        for repo in repos:
+            self._pending.put(repo)
+        self._results = Queue.Queue(maxsize=GREP_QUEUE_SIZE)
+        self._cancelled = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def run(self, pool_size):
+        self._workers = [threading.Thread(target=self._work)
+                         for _ in range(min(pool_size,
+                                            self._pending.qsize()))]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+        remaining = len(self._workers)
+        while remaining:
+            result = self._results.get()
+            if result is None:
+                remaining -= 1
+            else:
+                yield result
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            for process in self._processes:
+                if process.poll() is None:
+                    process.kill()
+        # workers left running would be torn down mid wait() at exit
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self):
+        try:
+            while not self._cancelled.is_set():
+                try:
+                    name, repo_location = self._pending.get_nowait()
+                except Queue.Empty:
+                    break
+                self._search(name, repo_location)
+        finally:
+            self._put(None)
+
+    def _search(self, name, repo_location):
+        with tempfile.TemporaryFile() as stderr:
+            with self._lock:
+                if self._cancelled.is_set():
+                    return
+                # run from the repo root so paths are repo relative
+                process = subprocess.Popen(
+                    ['git', '--no-pager', 'grep', '-n', '-I', '--no-color',
+                     '-e', self.pattern],
+                    cwd=repo_location,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr)
+                self._processes.add(process)
+            try:
+                for line in iter(process.stdout.readline, ''):
+                    if not self._put((name, line.rstrip('\n'), None)):
+                        break
+            finally:
+                process.stdout.close()
+                process.wait()
+                with self._lock:
+                    self._processes.discard(process)
+            # git grep exits with 1 when nothing matched
+            if process.returncode > 1 and not self._cancelled.is_set():
+                stderr.seek(0)
+                error = stderr.read().strip() or 'exit code {0}'.format(
+                    process.returncode)
+                self._put((name, None, error))
+
+    def _put(self, result):
+        # the consumer stops reading once cancelled, so never block on a
+        # full queue past that point
+        while not self._cancelled.is_set():
+            try:
+                self._results.put(result, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+
+def _name_formatting(repos):
+    return '{0:<' + str(max(len(name) for name, _ in repos) + 1) + '}'
+
+
+def git_repos(active=False, repo_type=None):
+    active_repos = None
+    if active:
+        active_feature = features.get(features.active_feature) or {}
+        active_repos = active_feature.get('repos') or []
+    repos = []
+    for node in ctx.env.storage.get_nodes():
+        if node.type != 'git_repo':
+            continue
+        name = node.properties['name']
+        if repo_type and node.properties.get('repo_type') != repo_type:
+            continue
+        if active_repos is not None and name not in active_repos:
+            continue
+        repo_location = path(node.properties['location']).expanduser() / name
+        if (repo_location / '.git').isdir():
+            repos.append((name, repo_location))
+    return sorted(repos)
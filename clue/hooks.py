@@ -14,13 +14,16 @@
 # limitations under the License.
 ############
 
+from clue import imports
+
 
 def after_env_create(loader, **kwargs):
     features_yaml = loader.user_config.storage_dir / 'features.yaml'
     features_yaml.touch()
 
 
-def before_init(blueprint, inputs, **kwargs):
+def before_init(blueprint, inputs, loader, **kwargs):
+    imports.resolve(blueprint, loader.user_config.storage_dir)
     node_templates = blueprint['node_templates']
     repos = inputs.pop('repos', {})
     for repo_name, repo in repos.items():
@@ -0,0 +1,113 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import contextlib
+import hashlib
+import os
+import urllib
+import urllib2
+
+import argh
+import yaml
+from clash import ctx
+
+from clue import store
+
+VENDORED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'blueprint', 'imports')
+CACHE_DIR = 'imports'
+INDEX_FILE = 'index.yaml'
+REMOTE_SCHEMES = ('http', 'https', 'ftp')
+FETCH_TIMEOUT = 30
+
+
+def resolve(blueprint, storage_dir):
+    """Point remote blueprint imports at their cached or vendored copies.
+
+    The storage dir cache (filled by 'clue imports refresh') takes
+    precedence over the copies shipped with clue. Remote imports that are
+    not cached anywhere fail instead of being fetched by the DSL parser."""
+    cache_dirs = [os.path.join(storage_dir, CACHE_DIR), VENDORED_DIR]
+    indexes = [(cache_dir, _load_index(cache_dir)) for cache_dir in cache_dirs]
+    imports = []
+    missing = []
+    for import_url in blueprint.get('imports', []):
+        for cache_dir, index in indexes:
+            file_name = index.get(import_url)
+            if file_name:
+                import_url = 'file:{0}'.format(urllib.pathname2url(
+                    os.path.join(cache_dir, file_name)))
+                break
+        else:
+            if import_url.split(':')[0] in REMOTE_SCHEMES:
+                missing.append(import_url)
+        imports.append(import_url)
+    if missing:
+        raise argh.CommandError(
+            'Blueprint imports are not cached: {0}. Run "clue imports '
+            'refresh" to fetch them.'.format(', '.join(missing)))
+    blueprint['imports'] = imports
+
+
+def refresh():
+    storage_dir = ctx.user_config.storage_dir
+    if not storage_dir:
+        raise argh.CommandError('No storage dir configured, '
+                                'run "clue env create" first')
+    cache_dir = os.path.join(storage_dir, CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    blueprint = yaml.safe_load(ctx.config.blueprint_path.text())
+    index = _load_index(cache_dir)
+    for import_url in blueprint.get('imports', []):
+        if import_url.split(':')[0] not in REMOTE_SCHEMES:
+            continue
+        content = _fetch(import_url)
+        # cached copies are named by their content so a refresh never
+        # modifies a file that a running parse may be reading
+        file_name = '{0}.yaml'.format(hashlib.sha256(content).hexdigest())
+        file_path = os.path.join(cache_dir, file_name)
+        if not os.path.exists(file_path):
+            store.atomic_write(file_path, content)
+        previous = index.get(import_url)
+        index[import_url] = file_name
+        print '{0}: {1}'.format(
+            import_url, 'unchanged' if previous == file_name else 'updated')
+    store.atomic_write(os.path.join(cache_dir, INDEX_FILE),
+                       yaml.safe_dump(index, default_flow_style=False))
+    referenced = set(index.values()) | {INDEX_FILE}
+    for name in os.listdir(cache_dir):
+        if name not in referenced and not name.startswith('.'):
+            os.remove(os.path.join(cache_dir, name))
+
+
+def _fetch(import_url):
+    try:
+        with contextlib.closing(urllib2.urlopen(
+                import_url, timeout=FETCH_TIMEOUT)) as f:
+            return f.read()
+    except (urllib2.URLError, IOError) as e:
+        raise argh.CommandError('Failed fetching {0}: {1}'.format(
+            import_url, e))
+
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return yaml.safe_load(f) or {}
+    except IOError:
+        return {}
@@ -0,0 +1,30 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import argparse
+
+from clash import ctx
+
+from clue import completion
+
+
+def install(verbose):
+    command = ctx._parse_command('install', {'workflow': 'install'})
+    command(argparse.Namespace(verbose=verbose))
+    env = ctx.env
+    completion.write_index(env)
+    completion.update_branches_index(env)
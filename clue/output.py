@@ -18,22 +18,48 @@ import colors
 
 from clash.output import Event
 
+_LINE_MARKER = '\0'
+# workflows whose own info logs are summaries printed without a prefix
+SUMMARY_WORKFLOWS = ['git_pull', 'feature_hub']
+
+
+class LinesEvent(Event):
+    """Formats each line of a multi-line message as an event of its own.
+
+    Command output is logged in multi-line batches."""
+
+    def __str__(self):
+        text = self.get('message', {}).get('text') or ''
+        if '\n' not in text:
+            return self.format()
+        # the event is formatted once, each line is put in place of the
+        # message
+        line_event = self.__class__(self)
+        line_event['message'] = dict(self['message'], text=_LINE_MARKER)
+        formatted = line_event.format()
+        return '\n'.join(formatted.replace(_LINE_MARKER, line)
+                         for line in self.message.split('\n'))
+
+    def format(self):
+        return super(LinesEvent, self).__str__()
+
 
 class NamedNodeEvent(object):
 
     @staticmethod
     def factory(env, verbose, command):
         max_len = 0
-        git_command = command.get('parameters', {}).get(
-            'operation').startswith('git.')
+        operation = command.get('parameters', {}).get('operation') or ''
+        git_command = (operation.startswith(('git.', 'hub.')) or
+                       command['workflow'].startswith(('git_', 'feature_')))
         node_type = 'git_repo' if git_command else 'python_package'
         for node in env.storage.get_nodes():
             if node.type == node_type:
                 max_len = max(max_len, len(node.properties['name']))
         formatting = '{0:<' + str(max_len + 1) + '}'
 
-        class NamedNodeEventImpl(Event):
-            def __str__(self):
+        class NamedNodeEventImpl(LinesEvent):
+            def format(self):
                 if (not verbose and self.level and
                         self.level.lower() in ['info', 'warning'] and
                         self.node_name):
@@ -41,8 +67,13 @@ class NamedNodeEvent(object):
                     name = node.properties['name']
                     name = colors.green(formatting.format(name))
                     return ' {0}| {1}'.format(name, self.message)
+                elif (not verbose and self.level and
+                        self.level.lower() == 'info' and
+                        not self.node_name and
+                        self.workflow_id in SUMMARY_WORKFLOWS):
+                    return self.message
                 else:
-                    return super(NamedNodeEventImpl, self).__str__()
+                    return super(NamedNodeEventImpl, self).format()
         return NamedNodeEventImpl
 
 
@@ -50,10 +81,10 @@ class NoseEvent(object):
 
     @staticmethod
     def factory(env, verbose, command):
-        class NoseEventImpl(Event):
-            def __str__(self):
+        class NoseEventImpl(LinesEvent):
+            def format(self):
                 if not verbose:
                     return self.message
                 else:
-                    return super(NoseEventImpl, self).__str__()
+                    return super(NoseEventImpl, self).format()
         return NoseEventImpl
@@ -0,0 +1,87 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import json
+import os
+import socket
+import sys
+
+import colors
+
+from clue import config
+
+SOCKET_NAME = 'status.sock'
+CONNECT_TIMEOUT = 1
+
+
+def fast_prompt():
+    """Answer 'clue git prompt' from the status daemon without loading the
+    clue command line.
+
+    Returns without printing anything when the daemon can't be reached, so
+    the caller falls back to the regular command, which reports it."""
+    try:
+        env_dir = config.env_dir()
+        repos = read_states(os.path.join(env_dir, SOCKET_NAME)) \
+            if env_dir else None
+    except Exception:
+        repos = None
+    if repos is None:
+        return
+    print_states(repos)
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def read_states(socket_path):
+    """The cached state of each repo, or None if the daemon is not
+    running."""
+    client = connect(socket_path)
+    if not client:
+        return None
+    try:
+        data = ''
+        while True:
+            chunk = client.recv(64 * 1024)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+    return json.loads(data)['repos']
+
+
+def print_states(repos):
+    if not repos:
+        return
+    formatting = '{0:<' + str(max(len(name) for name in repos) + 1) + '}'
+    for name, state in sorted(repos.items()):
+        print ' {0}| {1}'.format(colors.green(formatting.format(name)),
+                                 state.get('error') or state['branch_state'])
+
+
+def connect(socket_path):
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        client.close()
+        return None
+    return client
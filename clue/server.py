@@ -0,0 +1,330 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import copy
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+from clue import config
+
+CONNECT_TIMEOUT = 1
+# seconds between checks for finished commands while no request arrives
+REAP_INTERVAL = 1
+STARTED = 'started'
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+_STD_FDS = (0, 1, 2)
+
+
+def forward(socket_path):
+    """Run the current command in the clue server listening on socket_path.
+
+    Returns without doing anything when the command should run in this
+    process instead."""
+    client = _connect(socket_path)
+    if not client:
+        return
+    import _multiprocessing
+    try:
+        for fd in _STD_FDS:
+            _multiprocessing.sendfd(client.fileno(), fd)
+        client.sendall(json.dumps({
+            'argv': sys.argv[1:],
+            'cwd': os.getcwd(),
+            'env': dict(os.environ)
+        }) + '\n')
+        client.settimeout(None)
+        reader = client.makefile('rb')
+        if reader.readline().strip() != STARTED:
+            client.close()
+            return
+    except (socket.error, OSError):
+        client.close()
+        return
+
+    # the command does not run in this terminal's process group
+    def forward_signal(signum, _):
+        try:
+            client.sendall('{0}\n'.format(signum))
+        except socket.error:
+            pass
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, forward_signal)
+    exit_code = reader.readline().strip()
+    sys.exit(int(exit_code) if exit_code else 1)
+
+
+def server():
+    import argh
+    socket_path = config.server_socket_path()
+    client = _connect(socket_path)
+    if client:
+        client.close()
+        raise argh.CommandError('clue server is already running')
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    state = ServerState(config.CONFIG_PATH)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # remove the socket on termination as well
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    restart = False
+    try:
+        listener.bind(socket_path)
+        listener.listen(16)
+        print 'Listening on {0}'.format(socket_path)
+        sys.stdout.flush()
+        restart = _serve(listener, state)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    if restart:
+        print 'clue changed on disk, restarting'
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+class ServerState(object):
+    """Keeps a loaded clash loader, env and features between commands.
+
+    The loader is rebuilt when clash.yaml, the user config, inputs, macros
+    or the blueprint change. The env is reloaded when 'clue init' rewrites
+    its stored plan. Changes to clue's own code restart the server."""
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.loader = None
+        self._state_key = None
+        self._code_key = _code_key()
+
+    def code_changed(self):
+        return _code_key() != self._code_key
+
+    def refresh(self):
+        state_key = self._current_state_key()
+        if state_key == self._state_key:
+            return
+        self._state_key = state_key
+        self.loader = None
+        try:
+            self.loader = self.load()
+        except Exception:
+            # the command reports the error when it loads by itself
+            pass
+
+    def load(self):
+        from clash.loader import Loader
+        loader = Loader(config_path=self.config_path)
+        storage_dir = loader.user_config.storage_dir
+        if not storage_dir:
+            return loader
+        _cache_env(loader, os.path.join(storage_dir, config.ENV_DIR, 'data'))
+        _cache_inputs(loader)
+        try:
+            loader.env
+        except (IOError, OSError):
+            # not initialized yet
+            return loader
+        inputs = loader.user_config.inputs
+        if inputs.get('features_file'):
+            from clue import store
+            store.get_store(inputs['features_file'],
+                            inputs.get('features_store')).load()
+        import clue.feature  # noqa
+        import clue.output  # noqa
+        return loader
+
+    def _current_state_key(self):
+        clash_config = config.load(self.config_path)
+        paths = [self.config_path,
+                 config.user_config_path(clash_config),
+                 os.path.join(os.path.dirname(self.config_path),
+                              clash_config['blueprint_path'])]
+        env_dir = config.env_dir(clash_config)
+        if env_dir:
+            storage_dir = os.path.dirname(env_dir)
+            paths += [os.path.join(storage_dir, 'inputs.yaml'),
+                      os.path.join(storage_dir, 'macros.yaml')]
+        return [_stat_key(p) for p in paths]
+
+
+def _serve(listener, state):
+    import _multiprocessing
+    while True:
+        _reap()
+        readable, _, _ = select.select([listener], [], [], REAP_INTERVAL)
+        if not readable:
+            continue
+        connection, _ = listener.accept()
+        fds = []
+        try:
+            for _ in _STD_FDS:
+                fds.append(_multiprocessing.recvfd(connection.fileno()))
+            request = json.loads(connection.makefile('rb').readline())
+            if state.code_changed():
+                return True
+            state.refresh()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                listener.close()
+                _run(state, connection, fds, request)
+        except RuntimeError:
+            # probing connections close without sending any descriptors
+            pass
+        except (socket.error, OSError, ValueError):
+            traceback.print_exc()
+        finally:
+            for fd in fds:
+                os.close(fd)
+            connection.close()
+
+
+def _run(state, connection, fds, request):
+    exit_code = 1
+    try:
+        os.setpgrp()
+        for fd, std_fd in zip(fds, _STD_FDS):
+            os.dup2(fd, std_fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = sys.argv[:1] + request['argv']
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        for signum in FORWARDED_SIGNALS[1:]:
+            signal.signal(signum, signal.SIG_DFL)
+        connection.sendall('{0}\n'.format(STARTED))
+        watcher = threading.Thread(target=_receive_signals,
+                                   args=(connection,))
+        watcher.daemon = True
+        watcher.start()
+        exit_code = _dispatch(state)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            connection.sendall('{0}\n'.format(exit_code))
+        except (IOError, socket.error):
+            pass
+        os._exit(exit_code)
+
+
+def _dispatch(state):
+    loader = state.loader or state.load()
+    try:
+        loader.dispatch()
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        sys.stderr.write('{0}\n'.format(e.code))
+        return 1
+    return 0
+
+
+def _receive_signals(connection):
+    reader = connection.makefile('rb')
+    while True:
+        line = reader.readline()
+        if not line:
+            # the client is gone
+            os.killpg(0, signal.SIGTERM)
+            return
+        os.killpg(0, int(line))
+
+
+def _cache_env(loader, data_path):
+    load_env = loader._load_env
+    cache = {}
+
+    def cached_load_env():
+        key = _stat_key(data_path)
+        if cache.get('key') != key:
+            cache['env'] = load_env()
+            cache['key'] = key
+        return cache['env']
+    loader._load_env = cached_load_env
+
+
+def _cache_inputs(loader):
+    # clash parses inputs.yaml with the pure python yaml loader each time
+    # inputs are read, which is often several times per command
+    base = loader.user_config.__class__
+    cache = {}
+
+    class UserConfig(base):
+
+        @property
+        def inputs(self):
+            key = _stat_key(self.inputs_path)
+            if cache.get('key') != key:
+                cache['inputs'] = base.inputs.fget(self)
+                cache['key'] = key
+            return copy.deepcopy(cache['inputs'])
+
+        @inputs.setter
+        def inputs(self, value):
+            base.inputs.fset(self, value)
+    loader.user_config.__class__ = UserConfig
+
+
+def _reap():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            return
+        if not pid:
+            return
+
+
+def _code_key():
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    return sorted((name, _stat_key(os.path.join(package_dir, name)))
+                  for name in os.listdir(package_dir)
+                  if name.endswith('.py'))
+
+
+def _stat_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size, stat.st_ino]
+
+
+def _connect(socket_path):
+    if not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        client.close()
+        return None
+    return client
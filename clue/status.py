@@ -0,0 +1,330 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import argh
+from path import path
+
+from clash import ctx
+
+from clue import config
+from clue.git import git_repos
+from clue.prompt import SOCKET_NAME
+from clue.prompt import connect
+from clue.prompt import print_states
+from clue.prompt import read_states
+
+STATUS_POOL_SIZE = 10
+# events are coalesced until no new event arrived for DEBOUNCE_INTERVAL
+# seconds, but never for longer than MAX_DEBOUNCE_INTERVAL seconds
+DEBOUNCE_INTERVAL = 0.2
+MAX_DEBOUNCE_INTERVAL = 1
+# repos that cannot be watched with inotify are recomputed periodically
+POLL_INTERVAL = 5
+# directories that change often but never affect git status
+IGNORED_DIRS = set(['.tox', 'node_modules', '__pycache__'])
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF |
+              IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def daemon():
+    porcelain = _import_porcelain()
+    socket_path = _socket_path()
+    if connect(socket_path):
+        raise argh.CommandError('Status daemon is already running')
+    if _git_version() < porcelain.PORCELAIN_V2_VERSION:
+        raise argh.CommandError('The status daemon requires git >= {0}'
+                                .format('.'.join(
+                                    str(v) for v in
+                                    porcelain.PORCELAIN_V2_VERSION)))
+    repos = dict(git_repos())
+    if not repos:
+        raise argh.CommandError('No repositories to watch')
+    if socket_path.exists():
+        socket_path.remove()
+    status_daemon = StatusDaemon(repos, porcelain)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # remove the socket on termination as well
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.bind(socket_path)
+        server.listen(16)
+        status_daemon.start(server)
+        print 'Watching {0} repositories. Listening on {1}'.format(
+            len(repos), socket_path)
+        status_daemon.watch()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if socket_path.exists():
+            socket_path.remove()
+
+
+def prompt():
+    # usually answered by prompt.fast_prompt before clash is loaded
+    repos = read_states(_socket_path())
+    if repos is None:
+        raise argh.CommandError('Status daemon is not running. Start it with '
+                                '"clue status-daemon"')
+    print_states(repos)
+
+
+class StatusDaemon(object):
+
+    def __init__(self, repos, porcelain):
+        self.repos = repos
+        self.porcelain = porcelain
+        self.show_stash = _git_version() >= porcelain.SHOW_STASH_VERSION
+        self._states = {}
+        self._states_lock = threading.Lock()
+        self._pool = ThreadPool(STATUS_POOL_SIZE)
+
+    def start(self, server):
+        thread = threading.Thread(target=self._serve, args=(server,))
+        thread.daemon = True
+        thread.start()
+
+    def watch(self):
+        try:
+            inotify = Inotify()
+        except OSError as e:
+            print 'inotify is not available ({0}). Polling every {1} ' \
+                  'seconds.'.format(e, POLL_INTERVAL)
+            inotify = None
+        watches = {}
+        polled = set(self.repos)
+        if inotify:
+            for name, repo_location in self.repos.items():
+                if self._add_watches(inotify, watches, name, repo_location):
+                    polled.discard(name)
+                else:
+                    print 'Too many directories to watch in {0}. Polling ' \
+                          'it every {1} seconds.'.format(name, POLL_INTERVAL)
+        self._update(self.repos.keys())
+        changed = set()
+        first_change = last_change = None
+        last_poll = time.time()
+        while True:
+            now = time.time()
+            timeout = last_poll + POLL_INTERVAL - now
+            if changed:
+                timeout = min(timeout, last_change + DEBOUNCE_INTERVAL - now,
+                              first_change + MAX_DEBOUNCE_INTERVAL - now)
+            events = []
+            if inotify and timeout > 0:
+                events = inotify.read(timeout)
+            elif timeout > 0:
+                time.sleep(timeout)
+            now = time.time()
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.repos)
+                    continue
+                watched = watches.get(wd)
+                if not watched:
+                    continue
+                repo, directory = watched
+                if mask & IN_IGNORED:
+                    watches.pop(wd, None)
+                    continue
+                if name.endswith('.lock'):
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    if not self._add_watches(inotify, watches, repo,
+                                             directory / name):
+                        polled.add(repo)
+                changed.add(repo)
+            if events and changed:
+                first_change = first_change or now
+                last_change = now
+            if now >= last_poll + POLL_INTERVAL:
+                changed.update(polled)
+                last_poll = now
+            if changed and (not events or
+                            now >= first_change + MAX_DEBOUNCE_INTERVAL):
+                self._update(changed)
+                changed = set()
+                first_change = last_change = None
+
+    def _add_watches(self, inotify, watches, repo, directory):
+        for root, dirs, _ in os.walk(directory):
+            # .git is watched separately, only where HEAD, the index
+            # and refs are stored
+            dirs[:] = [d for d in dirs
+                       if d != '.git' and d not in IGNORED_DIRS]
+            roots = [root]
+            if root == self.repos[repo]:
+                git_dir = path(root) / '.git'
+                roots += [git_dir]
+                for refs_dir in [git_dir / 'refs', git_dir / 'logs' / 'refs']:
+                    for refs_root, _, _ in os.walk(refs_dir):
+                        roots.append(refs_root)
+            for watched_dir in roots:
+                try:
+                    wd = inotify.add_watch(watched_dir, WATCH_MASK)
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        return False
+                    # removed while walking
+                    continue
+                watches[wd] = (repo, path(watched_dir))
+        return True
+
+    def _update(self, names):
+        names = list(names)
+        states = self._pool.map(
+            lambda name: self._status(self.repos[name]), names)
+        with self._states_lock:
+            self._states.update(zip(names, states))
+
+    def _status(self, repo_location):
+        args = ['git', '--git-dir', repo_location / '.git',
+                '--work-tree', repo_location,
+                'status', '--porcelain=v2', '--branch']
+        if self.show_stash:
+            args.append('--show-stash')
+        env = os.environ.copy()
+        # do not refresh the index, which would trigger another change
+        env['GIT_OPTIONAL_LOCKS'] = '0'
+        process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=env,
+                                   cwd=repo_location)
+        output, error = process.communicate()
+        if process.returncode != 0:
+            return {'error': error.strip(), 'updated': time.time()}
+        state = self.porcelain.parse(output)
+        git_dir = repo_location / '.git'
+        if not self.show_stash and self.porcelain.has_stash(git_dir):
+            state.stash = 1
+        self.porcelain.read_operation(state, git_dir)
+        return {
+            'branch_state': state.branch_state(),
+            'head': state.head,
+            'oid': state.oid,
+            'upstream': state.upstream,
+            'ahead': state.ahead,
+            'behind': state.behind,
+            'stash': state.stash,
+            'dirty': state.dirty,
+            'operation': state.operation,
+            'updated': time.time()
+        }
+
+    def _serve(self, server):
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.error:
+                return
+            try:
+                with self._states_lock:
+                    data = json.dumps({'repos': self._states})
+                connection.sendall(data)
+            except socket.error:
+                pass
+            finally:
+                connection.close()
+
+
+class Inotify(object):
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError(errno.ENOSYS, 'libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init'):
+            raise OSError(errno.ENOSYS, 'inotify not supported')
+        self._libc = libc
+        self._fd = libc.inotify_init()
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, watched_path, mask):
+        wd = self._libc.inotify_add_watch(self._fd, str(watched_path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return wd
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+
+def _socket_path():
+    return path(ctx.env.storage._storage_dir) / SOCKET_NAME
+
+
+def _import_porcelain():
+    # the operations package is loaded from the blueprint dir, which is
+    # only on sys.path while clash runs blueprint operations
+    blueprint_path = config.load(config.CONFIG_PATH)['blueprint_path']
+    blueprint_dir = os.path.join(os.path.dirname(config.CONFIG_PATH),
+                                 os.path.dirname(blueprint_path))
+    if blueprint_dir not in sys.path:
+        sys.path.append(blueprint_dir)
+    from operations import porcelain
+    return porcelain
+
+
+def _git_version():
+    output = subprocess.check_output(['git', '--version'])
+    version = output.strip().split(' ')[2]
+    return tuple(int(part) for part in version.split('.')[:2]
+                 if part.isdigit())
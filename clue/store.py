@@ -0,0 +1,235 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import copy
+import fcntl
+import json
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import yaml
+
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(features_file, backend=None):
+    features_file = os.path.abspath(os.path.expanduser(features_file))
+    backend = backend or 'yaml'
+    key = (features_file, backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if backend == 'yaml':
+                store = YamlStore(features_file)
+            elif backend == 'sqlite':
+                store = SqliteStore(features_file)
+            else:
+                raise ValueError('Unknown features store: {0}'.format(
+                    backend))
+            _stores[key] = store
+        return store
+
+
+class YamlStore(object):
+
+    def __init__(self, features_file):
+        self.path = features_file
+        self._key = None
+        self._content = {}
+
+    def load(self):
+        return copy.deepcopy(self._read())
+
+    def get(self, name):
+        return copy.deepcopy(self._read().get(name))
+
+    def exists(self, name):
+        return name in self._read()
+
+    def names(self):
+        return sorted(self._read())
+
+    def save(self, value):
+        with self._lock():
+            self._write(value)
+
+    @contextmanager
+    def transaction(self):
+        # the lock is held from the read to the write so that concurrent
+        # clue invocations do not lose each other's updates
+        with self._lock():
+            content = copy.deepcopy(self._read())
+            yield content
+            self._write(content)
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            self._key = None
+            self._content = {}
+            return self._content
+        with f:
+            key = _stat_key(os.fstat(f.fileno()))
+            if key != self._key:
+                self._content = yaml.load(f.read(), Loader=YamlLoader) or {}
+                self._key = key
+        return self._content
+
+    def _write(self, value):
+        atomic_write(self.path, yaml.safe_dump(value,
+                                               default_flow_style=False))
+        self._content = copy.deepcopy(value)
+        self._key = _stat_key(os.stat(self.path))
+
+    def _lock(self):
+        return file_lock('{0}.lock'.format(self.path))
+
+
+class SqliteStore(YamlStore):
+
+    # features are indexed by name in a database next to the features
+    # file. the features file is still written on every change (it is
+    # read by the blueprint operations) and is imported back whenever it
+    # was modified outside of the store
+    def __init__(self, features_file):
+        super(SqliteStore, self).__init__(features_file)
+        self.db_path = '{0}.db'.format(os.path.splitext(features_file)[0])
+        self._connection = None
+
+    def load(self):
+        return dict((name, json.loads(data)) for name, data in
+                    self._db().execute('SELECT name, data FROM features'))
+
+    def get(self, name):
+        row = self._db().execute('SELECT data FROM features WHERE name = ?',
+                                 (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def exists(self, name):
+        return self._db().execute('SELECT 1 FROM features WHERE name = ?',
+                                  (name,)).fetchone() is not None
+
+    def names(self):
+        return [name for name, in self._db().execute(
+            'SELECT name FROM features ORDER BY name')]
+
+    def _write(self, value):
+        super(SqliteStore, self)._write(value)
+        self._import(value)
+
+    def _db(self):
+        if self._import_key() != self._features_file_key():
+            with self._lock():
+                if self._import_key() != self._features_file_key():
+                    self._import(self._read())
+        return self._connect()
+
+    def _connect(self):
+        if self._connection is None:
+            import sqlite3
+            self._connection = sqlite3.connect(self.db_path,
+                                               check_same_thread=False)
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS features (
+                    name TEXT PRIMARY KEY,
+                    data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL);
+            """)
+        return self._connection
+
+    def _import_key(self):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE key = 'features_file'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _features_file_key(self):
+        try:
+            return list(_stat_key(os.stat(self.path)))
+        except OSError:
+            return []
+
+    def _import(self, content):
+        connection = self._connect()
+        with connection:
+            connection.execute('DELETE FROM features')
+            connection.executemany(
+                'INSERT INTO features (name, data) VALUES (?, ?)',
+                [(name, json.dumps(feature))
+                 for name, feature in content.items()])
+            connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) '
+                "VALUES ('features_file', ?)",
+                (json.dumps(self._features_file_key()),))
+
+
+def _stat_key(file_stat):
+    return file_stat.st_mtime, file_stat.st_size, file_stat.st_ino
+
+
+def atomic_write(file_path, content):
+    # also used by the blueprint operations
+    directory = os.path.dirname(file_path)
+    _makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix='.{0}-'.format(os.path.basename(file_path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        # mkstemp creates the file with mode 0600
+        os.chmod(temp_path, _file_mode(file_path))
+        os.rename(temp_path, file_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def file_lock(lock_path):
+    _makedirs(os.path.dirname(lock_path))
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _file_mode(file_path):
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _makedirs(directory):
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created concurrently
+            if not os.path.isdir(directory):
+                raise
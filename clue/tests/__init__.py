@@ -14,6 +14,7 @@
 # limitations under the License.
 ############
 
+import importlib
 import tempfile
 import unittest
 import shutil
@@ -28,6 +29,17 @@ CLUE_CONFIG_PATH = 'CLUE_CONFIG_PATH'
 WORKON_HOME = 'WORKON_HOME'
 VIRTUALENVWRAPPER_PYTHON = 'VIRTUALENVWRAPPER_PYTHON'
 VIRTUALENVWRAPPER_VIRTUALENV = 'VIRTUALENVWRAPPER_VIRTUALENV'
+BLUEPRINT_DIR = path(__file__).abspath().dirname().dirname() / 'blueprint' / \
+    'cloudify-dev'
+RESOURCES_DIR = path(__file__).abspath().dirname() / 'resources'
+TYPES_URL = 'http://www.getcloudify.org/spec/cloudify/3.3/types.yaml'
+
+
+def import_operations(name):
+    # operations modules are loaded from the blueprint dir at runtime
+    if BLUEPRINT_DIR not in sys.path:
+        sys.path.append(BLUEPRINT_DIR)
+    return importlib.import_module('operations.{0}'.format(name))
 
 
 class BaseTest(unittest.TestCase):
@@ -60,6 +72,17 @@ class BaseTest(unittest.TestCase):
                      VIRTUALENVWRAPPER_VIRTUALENV]:
             os.environ.pop(prop, None)
 
+    def env_create(self, **kwargs):
+        result = self.clue.env.create(**kwargs)
+        # the tests parse the blueprint with a stand-in types.yaml instead of
+        # fetching the published one
+        cache_dir = self.storage_dir(kwargs.get('name', 'main')) / 'imports'
+        cache_dir.makedirs_p()
+        (RESOURCES_DIR / 'types.yaml').copy(cache_dir / 'types.yaml')
+        (cache_dir / 'index.yaml').write_text(yaml.safe_dump({
+            TYPES_URL: 'types.yaml'}))
+        return result
+
     def _load_conf(self):
         return yaml.safe_load(self.clue_conf_path.text())
 
@@ -94,9 +117,14 @@ class BaseTest(unittest.TestCase):
                      organization=None,
                      git_config=None,
                      register_python_argcomplete=None,
-                     virtualenv_name=None):
+                     virtualenv_name=None,
+                     clone_url=None,
+                     clone_mode=None,
+                     clone_depth=None,
+                     mirrors_dir=None,
+                     mirror_dissociate=None):
         try:
-            self.clue.env.create(repos_dir=self.repos_dir)
+            self.env_create(repos_dir=self.repos_dir)
             inputs = self.inputs()
             requirements = requirements or []
             constraints = constraints or []
@@ -118,7 +146,45 @@ class BaseTest(unittest.TestCase):
                 inputs['git_config'] = git_config
             if organization:
                 inputs['organization'] = organization
+            if clone_url:
+                inputs['clone_url'] = clone_url
+            if clone_mode:
+                inputs['clone_mode'] = clone_mode
+            if clone_depth:
+                inputs['clone_depth'] = clone_depth
+            if mirrors_dir:
+                inputs['mirrors_dir'] = mirrors_dir
+            if mirror_dissociate:
+                inputs['mirror_dissociate'] = mirror_dissociate
             self.set_inputs(inputs)
             return self.clue.apply()
         except sh.ErrorReturnCode as e:
             self.fail(e.stdout)
+
+    @property
+    def remotes_dir(self):
+        return self.workdir / 'remotes'
+
+    @property
+    def remote_clone_url(self):
+        return 'file://{0}/{{name}}.git'.format(self.remotes_dir)
+
+    def create_remote_repo(self, name, commits=3, branches=None):
+        source_dir = self.remotes_dir / 'sources' / name
+        bare_dir = self.remotes_dir / '{0}.git'.format(name)
+        source_dir.makedirs_p()
+        git = sh.git.bake(_cwd=source_dir)
+        git.init()
+        git('symbolic-ref', 'HEAD', 'refs/heads/master')
+        for i in range(commits):
+            (source_dir / 'file').write_text(str(i))
+            git.add('file')
+            git('-c', 'user.name=John Doe',
+                '-c', 'user.email=john@example.com',
+                'commit', '-m', 'commit {0}'.format(i))
+        for branch in branches or []:
+            git.branch(branch)
+        sh.git.clone(source_dir, bare_dir, bare=True)
+        sh.git('--git-dir', bare_dir, 'config', 'uploadpack.allowFilter',
+               'true')
+        return bare_dir
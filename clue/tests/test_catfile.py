@@ -0,0 +1,99 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import os
+import signal
+import tempfile
+import unittest
+
+import sh
+from path import path
+
+from clue import tests
+
+catfile = tests.import_operations('catfile')
+
+
+class TestCatFile(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = path(tempfile.mkdtemp(prefix='clue-catfile-'))
+        self.addCleanup(self.workdir.rmtree_p)
+        self.git = sh.git.bake('-c', 'user.name=John Doe',
+                               '-c', 'user.email=john@example.com',
+                               _cwd=self.workdir)
+        self.git.init()
+        (self.workdir / 'file').write_text('content\n')
+        self.git.add('file')
+        self.git.commit('-m', 'subject\n\nbody')
+        self.reader = catfile.ObjectReader(self.workdir / '.git')
+        self.addCleanup(self.reader.close)
+
+    def rev_parse(self, rev):
+        return self.git('rev-parse', rev).stdout.strip()
+
+    def test_read(self):
+        commit = self.reader.read('HEAD')
+        self.assertEqual(self.rev_parse('HEAD'), commit.object_id)
+        self.assertEqual('commit', commit.type)
+        self.assertEqual(len(commit.content), commit.size)
+        self.assertEqual('subject\n\nbody\n', commit.message)
+        blob = self.reader.read('HEAD:file')
+        self.assertEqual('blob', blob.type)
+        self.assertEqual('content\n', blob.content)
+        # the next object is read from the same stream
+        self.assertEqual(commit.content, self.reader.read('HEAD').content)
+
+    def test_info_and_resolve(self):
+        info = self.reader.info('HEAD:file')
+        self.assertEqual(self.rev_parse('HEAD:file'), info.object_id)
+        self.assertEqual('blob', info.type)
+        self.assertEqual(8, info.size)
+        self.assertIsNone(info.content)
+        self.assertEqual(self.rev_parse('HEAD'), self.reader.resolve('master'))
+
+    def test_missing(self):
+        self.assertIsNone(self.reader.read('missing'))
+        self.assertIsNone(self.reader.info('missing'))
+        self.assertIsNone(self.reader.resolve('HEAD:missing'))
+        process = self.reader._processes['--batch-check']
+        # revs with spaces are echoed back in the missing header
+        self.assertIsNone(self.reader.resolve('missing rev'))
+        self.assertIsNone(self.reader.read('missing rev'))
+        self.assertIs(process, self.reader._processes['--batch-check'])
+        self.assertEqual(self.rev_parse('HEAD'), self.reader.resolve('HEAD'))
+        with self.assertRaises(ValueError):
+            self.reader.read('HEAD\nHEAD')
+        with self.assertRaises(ValueError):
+            self.reader.read('')
+
+    def test_restart(self):
+        self.assertEqual(self.rev_parse('HEAD'), self.reader.resolve('HEAD'))
+        process = self.reader._processes['--batch-check']
+        os.kill(process.pid, signal.SIGKILL)
+        process.wait()
+        self.assertEqual(self.rev_parse('HEAD'), self.reader.resolve('HEAD'))
+        self.assertIsNot(process, self.reader._processes['--batch-check'])
+        self.reader.close()
+        self.assertEqual({}, self.reader._processes)
+        self.assertEqual('blob', self.reader.read('HEAD:file').type)
+
+    def test_get_reader(self):
+        reader = catfile.get_reader(self.workdir / '.git')
+        self.addCleanup(catfile.close_all)
+        self.assertIs(reader, catfile.get_reader(self.workdir / '.git'))
+        catfile.close_all()
+        self.assertIsNot(reader, catfile.get_reader(self.workdir / '.git'))
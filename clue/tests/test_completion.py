@@ -14,6 +14,8 @@
 # limitations under the License.
 ############
 
+import json
+
 import sh
 import yaml
 
@@ -24,7 +26,7 @@ class TestCompletion(tests.BaseTest):
 
     def setUp(self):
         super(TestCompletion, self).setUp()
-        self.clue.env.create(repos_dir=self.repos_dir)
+        self.env_create(repos_dir=self.repos_dir)
         inputs = self.inputs()
         inputs['repos'] = {'cloudify-dsl-parser': {},
                            'cloudify-versions': {'type': 'versions'}}
@@ -35,7 +37,8 @@ class TestCompletion(tests.BaseTest):
 
     def test_clue(self):
         builtin = ['init', 'status', 'env', 'apply'] + self.help_args
-        user = ['git', 'nose', 'pip', 'install', 'feature']
+        user = ['git', 'nose', 'pip', 'install', 'feature', 'status-daemon',
+                'server', 'imports']
         expected = builtin + user
         self.assert_completion(expected=expected)
 
@@ -51,7 +54,7 @@ class TestCompletion(tests.BaseTest):
     def test_git(self):
         builtin = self.help_args
         user = ['checkout', 'diff', 'pull', 'status', 'rebase', 'squash',
-                'reset']
+                'reset', 'log', 'grep', 'prompt']
         expected = builtin + user
         self.assert_completion(expected=expected,
                                args=['git'])
@@ -61,7 +64,36 @@ class TestCompletion(tests.BaseTest):
         expected = builtin + user
         self.assert_completion(expected=expected, args=['git', 'checkout'])
 
-        # TODO: add test for :: completion
+    def test_git_checkout_branches(self):
+        for name in ['cloudify-dsl-parser', 'cloudify-versions']:
+            bare_dir = self.create_remote_repo(name, commits=1,
+                                               branches=['3.3-build'])
+            sh.git.clone(bare_dir, self.repos_dir / name)
+        sh.git.tag('3.3', _cwd=self.repos_dir / 'cloudify-versions')
+        sh.git.branch('local-branch',
+                      _cwd=self.repos_dir / 'cloudify-dsl-parser')
+        payload_path = self.storage_dir() / '.local' / 'payload'
+        payload = json.loads(payload_path.text())
+        payload['versions_repo_location'] = str(
+            self.repos_dir / 'cloudify-versions')
+        payload_path.write_text(json.dumps(payload))
+
+        self.assert_completion(expected=['3.3-build'],
+                               args=['git', 'checkout'],
+                               prefix='3.')
+        self.assert_completion(expected=['local-branch'],
+                               args=['git', 'checkout'],
+                               prefix='lo')
+        self.assert_completion(expected=['3.3', '3.3-build'],
+                               args=['git', 'checkout'],
+                               prefix='::3')
+
+        # new refs invalidate the cached refs of their repo
+        sh.git.branch('local-branch2',
+                      _cwd=self.repos_dir / 'cloudify-dsl-parser')
+        self.assert_completion(expected=['local-branch', 'local-branch2'],
+                               args=['git', 'checkout'],
+                               prefix='lo')
 
     def test_feature(self):
         builtin = self.help_args
@@ -137,10 +169,51 @@ class TestCompletion(tests.BaseTest):
         expected = builtin + user
         self.assert_completion(expected=expected, args=['nose'])
 
+    def test_completion_index(self):
+        index_path = self.storage_dir() / '.local' / 'completion-index.json'
+        self.assert_completion(expected=['cloudify-dsl-parser'],
+                               args=['nose'],
+                               prefix='cloudify-d')
+        self.assertTrue(index_path.exists())
+
+        # served from the index without loading the env
+        index = json.loads(index_path.text())
+        index['packages'].append('cloudify-indexed')
+        index_path.write_text(json.dumps(index))
+        self.assert_completion(expected=['cloudify-dsl-parser',
+                                         'cloudify-indexed'],
+                               args=['nose'],
+                               prefix='cloudify-')
+
+        # changing the features file makes the index stale
+        features_yaml = self.workdir / 'features.yaml'
+        features_yaml.write_text(yaml.safe_dump({'test1': {}, 'test2': {}}))
+        self.assert_completion(expected=['test1', 'test2'],
+                               args=['feature', 'checkout'],
+                               prefix='te')
+        index = json.loads(index_path.text())
+        self.assertEqual(['test1', 'test2'], index['features'])
+        self.assertNotIn('cloudify-indexed', index['packages'])
+
+    def test_completion_index_relative_features_file(self):
+        (self.workdir / 'features.yaml').write_text(
+            yaml.safe_dump({'test1': {}}))
+        inputs = self.inputs()
+        inputs['features_file'] = 'features.yaml'
+        self.set_inputs(inputs)
+        self.clue.init(reset=True)
+        self.assert_completion(expected=['test1'],
+                               args=['feature', 'checkout'],
+                               prefix='te')
+        index_path = self.storage_dir() / '.local' / 'completion-index.json'
+        index = json.loads(index_path.text())
+        # sources are stored as the absolute paths store.get_store reads
+        self.assertIn(self.workdir / 'features.yaml', index['sources'])
+
     def assert_completion(self, expected, args=None,
-                          filter_non_options=False):
+                          filter_non_options=False, prefix="''"):
         args = args or []
-        args += ["''"]
+        args += [prefix]
         cmd = ['clue'] + list(args)
         partial_word = cmd[-1]
         cmdline = ' '.join(cmd)
@@ -14,6 +14,8 @@
 # limitations under the License.
 ############
 
+import os
+
 import sh
 import yaml
 
@@ -48,3 +50,123 @@ class TestFeature(tests.BaseTest):
         self.clue_install()
         # TODO: No real assertions for now
         self.clue.feature.list()
+
+    def test_create_add_repo_finish(self):
+        self.create_remote_repo('repo1', branches=['feat'])
+        self.create_remote_repo('repo2')
+        repo1_dir, repo2_dir = self._install_local_repos(['repo1', 'repo2'])
+        self.clue.feature.create('test', branch='feat')
+        features_yaml = self.workdir / 'features.yaml'
+        feature = yaml.safe_load(features_yaml.text())['test']
+        self.assertEqual(['repo1'], feature['repos'])
+        self.assertEqual('feat', self._current_branch(repo1_dir))
+        self.assertEqual('master', self._current_branch(repo2_dir))
+        self.clue.feature('add-repo', 'repo2')
+        feature = yaml.safe_load(features_yaml.text())['test']
+        self.assertEqual(['repo1', 'repo2'], feature['repos'])
+        self.assertEqual('feat', self._current_branch(repo2_dir))
+        self.clue.feature.finish()
+        self.assertNotIn('test', yaml.safe_load(features_yaml.text()) or {})
+        for repo_dir in [repo1_dir, repo2_dir]:
+            self.assertEqual('master', self._current_branch(repo_dir))
+            with repo_dir:
+                self.assertNotIn('feat', git.branch().stdout)
+
+    def test_list_status(self):
+        self.create_remote_repo('repo1', branches=['feat'])
+        self.create_remote_repo('repo2', branches=['feat'])
+        repo1_dir, repo2_dir = self._install_local_repos(['repo1', 'repo2'])
+        self.clue.feature.create('test', branch='feat')
+        with repo1_dir:
+            git.commit('--allow-empty', '-m', 'feature commit')
+        (repo2_dir / 'file').write_text('changed')
+        for _ in range(2):
+            output = self.clue.feature.list(status=True).stdout
+            lines = output.strip().split('\n')
+            self.assertIn('AHEAD', lines[0])
+            repo1_line, = [line for line in lines if 'repo1' in line]
+            repo2_line, = [line for line in lines if 'repo2' in line]
+            self.assertEqual(['1', '0'], repo1_line.split()[-2:])
+            self.assertIn('merged, dirty', repo2_line)
+
+    def test_list_status_base_and_errors(self):
+        self.create_remote_repo('repo1', branches=['feat', '3.4-build'])
+        self.create_remote_repo('repo2', branches=['feat'])
+        repo1_dir, repo2_dir = self._install_local_repos(['repo1', 'repo2'])
+        features_yaml = self.workdir / 'features.yaml'
+        features_yaml.write_text(yaml.safe_dump({
+            'test': {'branch': 'feat', 'base': '.4-build',
+                     'repos': ['repo1', 'repo2']}
+        }))
+        # core repo bases are resolved like 'git checkout' resolves them
+        output = self.clue.feature.list(status=True).stdout
+        repo1_line, = [line for line in output.split('\n') if 'repo1' in line]
+        self.assertIn('merged', repo1_line)
+        self.assertNotIn('no base', repo1_line)
+        (repo2_dir / '.git' / 'HEAD').remove()
+        output = self.clue.feature.list(status=True).stdout
+        lines = output.split('\n')
+        repo1_line, = [line for line in lines if 'repo1' in line]
+        repo2_line, = [line for line in lines if 'repo2' in line]
+        self.assertIn('merged', repo1_line)
+        self.assertIn('error: fatal: not a git repository', repo2_line)
+
+    def test_sqlite_store(self):
+        self.create_remote_repo('repo1', branches=['feat'])
+        self._install_local_repos(['repo1'])
+        inputs = self.inputs()
+        inputs['features_store'] = 'sqlite'
+        self.set_inputs(inputs)
+        self.clue.feature.create('test', branch='feat')
+        features_yaml = self.workdir / 'features.yaml'
+        feature = yaml.safe_load(features_yaml.text())['test']
+        self.assertEqual(['repo1'], feature['repos'])
+        self.assertTrue((self.workdir / 'features.db').exists())
+        # changes made directly to the features file are imported
+        features_yaml.write_text(yaml.safe_dump({
+            'other': {'branch': 'feat', 'repos': ['repo1']}
+        }))
+        output = self.clue.feature.list().stdout
+        self.assertIn('other', output)
+        self.assertNotIn('test', output)
+
+    def test_ci_status(self):
+        repos = ['repo1', 'repo2']
+        for repo in repos:
+            self.create_remote_repo(repo)
+        self._install_local_repos(repos)
+        features_yaml = self.workdir / 'features.yaml'
+        features_yaml.write_text(yaml.safe_dump({
+            'test': {'branch': 'master', 'repos': ['repo1']}
+        }))
+        self.clue.feature.checkout('test')
+        bin_dir = self.workdir / 'bin'
+        bin_dir.mkdir()
+        calls = self.workdir / 'hub-calls'
+        hub = bin_dir / 'hub'
+        hub.write_text('#!/bin/sh\n'
+                       'echo "$GIT_DIR $@" >> {0}\n'
+                       'echo "success ci/test"\n'.format(calls))
+        hub.chmod(0o755)
+        self.addCleanup(os.environ.__setitem__, 'PATH', os.environ['PATH'])
+        os.environ['PATH'] = '{0}:{1}'.format(bin_dir, os.environ['PATH'])
+        for _ in range(2):
+            output = self.clue.feature('ci-status').stdout
+            self.assertIn('success ci/test', output)
+        # repo2 is not part of the feature and the second call is cached
+        self.assertEqual(1, len(calls.lines()))
+        self.assertIn('repo1', calls.text())
+        self.clue.feature('ci-status', cache_ttl=0)
+        self.assertEqual(2, len(calls.lines()))
+
+    def _install_local_repos(self, repos):
+        self.clue_install(repos=dict((repo, {'type': 'core', 'python': False})
+                                     for repo in repos),
+                          clone_url=self.remote_clone_url,
+                          git_config={'user.name': 'John Doe',
+                                      'user.email': 'john.doe@example.com'})
+        return [self.repos_dir / repo for repo in repos]
+
+    def _current_branch(self, repo_dir):
+        with repo_dir:
+            return git('rev-parse', '--abbrev-ref', 'HEAD').stdout.strip()
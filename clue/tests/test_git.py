@@ -14,6 +14,10 @@
 # limitations under the License.
 ############
 
+import os
+import shutil
+import time
+
 import sh
 import yaml
 
@@ -70,6 +74,106 @@ class TestGit(tests.BaseTest):
         self.assertEqual(origin, '{}cloudify-cosmo/cloudify-rest-client.git'
                                  .format(prefix))
 
+    def test_clone_url(self):
+        repo = 'local-repo'
+        self.create_remote_repo(repo)
+        repo_dir = self._install(repo=repo, clone_url=self.remote_clone_url)
+        with repo_dir:
+            origin = git.config('remote.origin.url').stdout.strip()
+        self.assertEqual(origin,
+                         'file://{0}/{1}.git'.format(self.remotes_dir, repo))
+
+    def test_clone_mode_shallow(self):
+        repo = 'local-repo'
+        self.create_remote_repo(repo, commits=5, branches=['other'])
+        repo_dir = self._install(repo=repo, clone_url=self.remote_clone_url,
+                                 clone_mode='shallow', clone_depth=2)
+        with repo_dir:
+            self.assertTrue((repo_dir / '.git' / 'shallow').exists())
+            self.assertEqual(
+                '2', git('rev-list', '--count', 'HEAD').stdout.strip())
+            self.assertIn('origin/other', git.branch('-r').stdout)
+
+    def test_clone_mode_blobless(self):
+        self._test_clone_mode_partial('blobless', 'blob:none')
+
+    def test_clone_mode_treeless(self):
+        self._test_clone_mode_partial('treeless', 'tree:0')
+
+    def _test_clone_mode_partial(self, clone_mode, clone_filter):
+        repo = '{0}-repo'.format(clone_mode)
+        self.create_remote_repo(repo)
+        repo_dir = self._install(repo=repo,
+                                 clone_url=self.remote_clone_url,
+                                 clone_mode=clone_mode)
+        with repo_dir:
+            self.assertEqual(clone_filter, git.config(
+                'remote.origin.partialclonefilter').stdout.strip())
+            self.assertEqual(
+                '3', git('rev-list', '--count', 'HEAD').stdout.strip())
+
+    def test_clone_mirror(self):
+        repo = 'local-repo'
+        mirrors_dir = self.workdir / 'mirrors'
+        mirror_dir = mirrors_dir / 'cloudify-cosmo' / '{0}.git'.format(repo)
+        remote_dir = self.create_remote_repo(repo, branches=['other'])
+        repo_dir = self.repos_dir / repo
+        self.clue_install(repos={repo: {'python': False}},
+                          clone_url=self.remote_clone_url,
+                          mirrors_dir=str(mirrors_dir))
+        self.assertTrue(mirror_dir.isdir())
+        alternates = repo_dir / '.git' / 'objects' / 'info' / 'alternates'
+        self.assertEqual(alternates.text().strip(), mirror_dir / 'objects')
+        with repo_dir:
+            self.assertEqual(git.config('remote.origin.url').stdout.strip(),
+                             'file://{0}'.format(remote_dir))
+            self.assertIn('origin/other', git.branch('-r').stdout)
+            git.fetch()
+
+        # re-clones reuse (and update) the existing mirror
+        with remote_dir:
+            git.branch('new-branch', 'master')
+        shutil.rmtree(repo_dir)
+        self.clue.apply()
+        self.assertIn('new-branch', git('--git-dir', mirror_dir,
+                                        'branch').stdout)
+
+    def test_clone_mirror_dissociate(self):
+        repo = 'local-repo'
+        self.create_remote_repo(repo)
+        repo_dir = self.repos_dir / repo
+        self.clue_install(repos={repo: {'python': False}},
+                          clone_url=self.remote_clone_url,
+                          mirrors_dir=str(self.workdir / 'mirrors'),
+                          mirror_dissociate=True)
+        alternates = repo_dir / '.git' / 'objects' / 'info' / 'alternates'
+        self.assertFalse(alternates.exists())
+        with repo_dir:
+            self.assertEqual(
+                '3', git('rev-list', '--count', 'HEAD').stdout.strip())
+
+    def test_squash_unshallows(self):
+        repo = 'cloudify-rest-client'
+        branch = 'test_branch'
+        self.create_remote_repo(repo, commits=5)
+        repo_dir = self._install(repo=repo, clone_url=self.remote_clone_url,
+                                 clone_mode='shallow',
+                                 git_config={
+                                     'user.name': 'John Doe',
+                                     'user.email': 'john.doe@example.com'})
+        self._update_features_yaml(branch=branch)
+        with repo_dir:
+            git.checkout('-b', branch)
+            for i in range(2):
+                (repo_dir / 'file').write_text('change {0}'.format(i))
+                git.commit('-am', 'change {0}'.format(i))
+        self.clue.feature.checkout('test')
+        self.clue.git.squash()
+        with repo_dir:
+            self.assertFalse((repo_dir / '.git' / 'shallow').exists())
+            self.assertEqual(
+                '6', git('rev-list', '--count', 'HEAD').stdout.strip())
+
     def test_configure(self):
         name = 'John Doe'
         email = 'john@example.com'
@@ -104,6 +208,80 @@ class TestGit(tests.BaseTest):
         with repo_dir:
             self.assertEqual(initial_status, git.status().stdout.strip())
 
+    def test_pull_skips_unchanged_remotes(self):
+        repos = ['repo1', 'repo2']
+        for repo in repos:
+            self.create_remote_repo(repo)
+        self.clue_install(repos=dict((repo, {'python': False})
+                                     for repo in repos),
+                          clone_url=self.remote_clone_url)
+        output = self.clue.git.pull().stdout
+        self.assertIn('Updated: repo1, repo2', output)
+        output = self.clue.git.pull().stdout
+        self.assertIn('Skipped (remote unchanged): repo1, repo2', output)
+        self.assertNotIn('Updated', output)
+        output = self.clue.git.pull(no_skip_unchanged=True).stdout
+        self.assertIn('Updated: repo1, repo2', output)
+        self.assertNotIn('Skipped', output)
+
+        source_dir = self.remotes_dir / 'sources' / 'repo2'
+        with source_dir:
+            (source_dir / 'file').write_text('new content')
+            git('-c', 'user.name=John Doe',
+                '-c', 'user.email=john@example.com',
+                'commit', '-am', 'new commit')
+            git.push(self.remotes_dir / 'repo2.git', 'master')
+            new_sha = self._current_sha()
+        output = self.clue.git.pull().stdout
+        self.assertIn('Updated: repo2', output)
+        self.assertIn('Skipped (remote unchanged): repo1', output)
+        with self.repos_dir / 'repo2':
+            self.assertEqual(new_sha, self._current_sha())
+
+        with self.remotes_dir / 'sources' / 'repo1':
+            git.tag('new-tag')
+            git.push(self.remotes_dir / 'repo1.git', 'new-tag')
+        output = self.clue.git.pull().stdout
+        self.assertIn('Updated: repo1', output)
+        with self.repos_dir / 'repo1':
+            self.assertIn('new-tag', git.tag().stdout)
+
+    def test_pull_reports_failures(self):
+        repos = ['repo1', 'repo2', 'repo3']
+        for repo in repos:
+            self.create_remote_repo(repo)
+        self.clue_install(repos=dict((repo, {'python': False})
+                                     for repo in repos),
+                          clone_url=self.remote_clone_url,
+                          git_config={'user.name': 'John Doe',
+                                      'user.email': 'john.doe@example.com'})
+        # repo1 diverges from its upstream
+        source_dir = self.remotes_dir / 'sources' / 'repo1'
+        with source_dir:
+            (source_dir / 'file').write_text('remote content')
+            git('-c', 'user.name=John Doe',
+                '-c', 'user.email=john@example.com',
+                'commit', '-am', 'remote commit')
+            git.push(self.remotes_dir / 'repo1.git', 'master')
+        with self.repos_dir / 'repo1':
+            (self.repos_dir / 'repo1' / 'file').write_text('local content')
+            git.commit('-am', 'local commit')
+            local_sha = self._current_sha()
+        # repo2 cannot be fetched
+        with self.repos_dir / 'repo2':
+            git.config('remote.origin.url', self.remotes_dir / 'missing.git')
+            repo2_sha = self._current_sha()
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.pull(retries=0)
+        output = c.exception.stdout
+        self.assertIn('Failed fetching (not merged): repo2', output)
+        self.assertIn('Could not fast-forward: repo1', output)
+        self.assertNotIn('repo3', output.split('Failed fetching')[1])
+        with self.repos_dir / 'repo1':
+            self.assertEqual(local_sha, self._current_sha())
+        with self.repos_dir / 'repo2':
+            self.assertEqual(repo2_sha, self._current_sha())
+
     def test_status(self):
         core_repo_dir, _, _ = self._install_repo_types_with_branches()
         output = self.clue.git.status().stdout.strip()
@@ -111,6 +289,9 @@ class TestGit(tests.BaseTest):
                                  r'.*cloudify-rest-client.*\| .*master')
         self.assertIn('cloudify-script-plugin', output)
         self.assertIn('flask-securest', output)
+        # output is buffered per repo and flushed in repo order
+        names = [line.split('|')[0].strip() for line in output.split('\n')]
+        self.assertEqual(names, sorted(names))
         self.clue.git.checkout('.3.1-build')
         with core_repo_dir:
             git.reset('HEAD~')
@@ -188,6 +369,139 @@ class TestGit(tests.BaseTest):
         self.clue.git.checkout('default')
         assert_master()
 
+    def test_checkout_preflight(self):
+        repo1_dir, repo2_dir = self._install_local_core_repos()
+        with repo2_dir:
+            (repo2_dir / 'file').write_text('local change')
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.checkout('other')
+        self.assertIn('Checkout preflight failed for: repo2',
+                      c.exception.stdout)
+        for repo_dir in [repo1_dir, repo2_dir]:
+            with repo_dir:
+                self.assertEqual('master', self._current_branch())
+        with repo2_dir:
+            git.checkout('file')
+        self.clue.git.checkout('other')
+        for repo_dir in [repo1_dir, repo2_dir]:
+            with repo_dir:
+                self.assertEqual('other', self._current_branch())
+
+    def test_checkout_rollback(self):
+        repo1_dir, repo2_dir = self._install_local_core_repos()
+        # a stale index lock is only detected by git when switching
+        index_lock = repo2_dir / '.git' / 'index.lock'
+        index_lock.write_text('')
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.checkout('other')
+        self.assertIn('Checkout failed for: repo2', c.exception.stdout)
+        for repo_dir in [repo1_dir, repo2_dir]:
+            with repo_dir:
+                self.assertEqual('master', self._current_branch())
+        index_lock.remove()
+
+    def test_checkout_preflight_untracked(self):
+        repo1_dir, repo2_dir = self._install_local_core_repos()
+        with repo2_dir:
+            git.rm('file')
+            git.commit('-m', 'remove file')
+            (repo2_dir / 'file').write_text('untracked')
+            (repo2_dir / 'new').write_text('untracked')
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.checkout('other')
+        self.assertIn('Checkout preflight failed for: repo2',
+                      c.exception.stdout)
+        self.assertIn('untracked file would be overwritten',
+                      c.exception.stdout)
+        for repo_dir in [repo1_dir, repo2_dir]:
+            with repo_dir:
+                self.assertEqual('master', self._current_branch())
+        (repo2_dir / 'file').remove()
+        self.clue.git.checkout('other')
+        for repo_dir in [repo1_dir, repo2_dir]:
+            with repo_dir:
+                self.assertEqual('other', self._current_branch())
+
+    def test_log(self):
+        repo1_dir, repo2_dir = self._install_local_core_repos()
+        commits = [(repo1_dir, 'Jane Doe'),
+                   (repo2_dir, 'John Doe'),
+                   (repo1_dir, 'John Doe')]
+        for i, (repo_dir, author) in enumerate(commits):
+            with repo_dir:
+                (repo_dir / 'timeline').write_text(str(i))
+                git.add('timeline')
+                git('-c', 'user.name={0}'.format(author),
+                    'commit', '-m', 'timeline {0}'.format(i),
+                    _env={'GIT_COMMITTER_DATE': '{0} +0000'.format(
+                        2000000000 + i), 'PATH': os.environ['PATH']})
+        output = self.clue.git.log(max_count=3).stdout.strip().split('\n')
+        self.assertEqual(3, len(output))
+        for line, (repo, message) in zip(output, [('repo1', 'timeline 2'),
+                                                  ('repo2', 'timeline 1'),
+                                                  ('repo1', 'timeline 0')]):
+            self.assertIn(repo, line)
+            self.assertIn(message, line)
+        output = self.clue.git.log(author='Jane').stdout.strip().split('\n')
+        self.assertEqual(1, len(output))
+        self.assertIn('timeline 0', output[0])
+        output = self.clue.git.log(since='2033-05-18').stdout
+        self.assertNotIn('commit 0', output)
+
+    def test_grep(self):
+        repo1_dir, repo2_dir = self._install_local_core_repos()
+        for repo_dir in [repo1_dir, repo2_dir]:
+            (repo_dir / 'module.py').write_text('first = 1\nsecond = 2\n')
+            with repo_dir:
+                git.add('module.py')
+        output = self.clue.git.grep('second').stdout.strip().split('\n')
+        self.assertEqual(2, len(output))
+        for line, repo in zip(sorted(o.strip() for o in output),
+                              ['repo1', 'repo2']):
+            self.assertIn(repo, line)
+            self.assertIn('module.py:2:second = 2', line)
+        output = self.clue.git.grep('=', max_results=3).stdout
+        self.assertEqual(3, len(output.strip().split('\n')))
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.grep('[')
+        self.assertIn('git grep failed for: repo1, repo2',
+                      c.exception.stdout)
+
+    def test_status_daemon(self):
+        repo1_dir, _ = self._install_local_core_repos()
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.git.prompt()
+        self.assertIn('Status daemon is not running', c.exception.stdout)
+        daemon = self.clue('status-daemon', _bg=True)
+        try:
+            output = self._wait_for_prompt(lambda o: 'repo2' in o)
+            self.assertIn('repo1', output)
+            self.assertNotIn('*', output)
+            with repo1_dir:
+                (repo1_dir / 'file').write_text('changed')
+            output = self._wait_for_prompt(lambda o: '*' in o)
+            dirty_line, = [line for line in output.split('\n') if '*' in line]
+            self.assertIn('repo1', dirty_line)
+        finally:
+            daemon.process.terminate()
+            try:
+                daemon.wait()
+            except sh.ErrorReturnCode:
+                pass
+
+    def _wait_for_prompt(self, predicate, timeout=10):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                output = self.clue.git.prompt().stdout
+                if predicate(output):
+                    return output
+            except sh.ErrorReturnCode:
+                pass
+            if time.time() > deadline:
+                self.fail('Timed out waiting for the status daemon')
+            time.sleep(0.2)
+
     def test_rebase(self):
         branch = '3.2.1-build'
         base = branch
@@ -346,8 +660,28 @@ class TestGit(tests.BaseTest):
         output = self.clue.git.diff(a=True).stdout.strip()
         self.assertEqual(0, len(output))
 
+    def test_diff_output_not_interleaved(self):
+        repo_dirs = self._install_local_core_repos(count=6)
+        for repo_dir in repo_dirs:
+            (repo_dir / 'file').write_text(
+                ''.join('line {0}\n'.format(i) for i in range(20000)))
+        output = self.clue.git.diff().stdout.strip()
+        names = [line.split('|')[0].strip() for line in output.split('\n')]
+        # the output of each repo is written in one block, in repo order
+        blocks = [name for i, name in enumerate(names)
+                  if i == 0 or name != names[i - 1]]
+        self.assertEqual(len(blocks), len(repo_dirs))
+        self.assertEqual(blocks, sorted(blocks))
+        for repo_dir, block in zip(repo_dirs, blocks):
+            self.assertIn(repo_dir.basename(), block)
+        output = self.clue.git.status().stdout.strip()
+        for repo_dir in repo_dirs:
+            self.assertRegexpMatches(
+                output, r'.*{0}.*\| .*M.*file'.format(repo_dir.basename()))
+
     def _install(self, repo=None, repo_base=None, properties=None,
-                 git_config=None, clone_method=None):
+                 git_config=None, clone_method=None, clone_url=None,
+                 clone_mode=None, clone_depth=None):
         properties = properties or {}
         repo = repo or 'cloudify-rest-client'
         if repo_base:
@@ -358,7 +692,8 @@ class TestGit(tests.BaseTest):
             repo: {'python': False, 'properties': properties, 'type': 'core'}
         }
         self.clue_install(repos=repos, git_config=git_config,
-                          clone_method=clone_method)
+                          clone_method=clone_method, clone_url=clone_url,
+                          clone_mode=clone_mode, clone_depth=clone_depth)
         return repo_dir
 
     def _install_repo_types_with_branches(self, branch='3.2.1-build',
@@ -399,6 +734,28 @@ class TestGit(tests.BaseTest):
         self.clue_install(repos=repos, git_config=git_config)
         return core_repo_dir, plugin_repo_dir, misc_repo_dir
 
+    def _install_local_core_repos(self, count=2):
+        repos = ['repo{0}'.format(i) for i in range(1, count + 1)]
+        for repo in repos:
+            self.create_remote_repo(repo)
+            source_dir = self.remotes_dir / 'sources' / repo
+            with source_dir:
+                git.checkout('-b', 'other')
+                (source_dir / 'file').write_text('other')
+                git('-c', 'user.name=John Doe',
+                    '-c', 'user.email=john@example.com',
+                    'commit', '-am', 'other')
+                git.push(self.remotes_dir / '{0}.git'.format(repo), 'other')
+        self.clue_install(repos=dict((repo, {'type': 'core', 'python': False})
+                                     for repo in repos),
+                          clone_url=self.remote_clone_url,
+                          git_config={'user.name': 'John Doe',
+                                      'user.email': 'john.doe@example.com'})
+        return [self.repos_dir / repo for repo in repos]
+
+    def _current_branch(self):
+        return git('rev-parse', '--abbrev-ref', 'HEAD').stdout.strip()
+
     def _current_sha(self):
         return git('rev-parse', 'HEAD').stdout.strip()
 
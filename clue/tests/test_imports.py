@@ -0,0 +1,86 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import os
+import tempfile
+import unittest
+import urllib
+
+import argh
+import yaml
+from path import path
+
+from clue import imports
+
+TYPES_URL = 'http://www.getcloudify.org/spec/cloudify/3.3/types.yaml'
+OTHER_URL = 'http://example.com/other.yaml'
+
+
+class TestImports(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = path(tempfile.mkdtemp(prefix='clue-imports-'))
+        self.addCleanup(self.workdir.rmtree_p)
+        self.storage_dir = self.workdir / 'storage'
+        self.cache_dir = self.storage_dir / imports.CACHE_DIR
+        self.vendored_dir = self.workdir / 'vendored'
+        vendored_dir = imports.VENDORED_DIR
+        imports.VENDORED_DIR = self.vendored_dir
+        self.addCleanup(setattr, imports, 'VENDORED_DIR', vendored_dir)
+
+    def test_shipped_index(self):
+        vendored_dir = path(os.path.dirname(imports.__file__)) / \
+            'blueprint' / 'imports'
+        index = yaml.safe_load((vendored_dir / 'index.yaml').text()) or {}
+        for file_name in index.values():
+            self.assertTrue((vendored_dir / file_name).isfile())
+
+    def test_resolve(self):
+        self._write_index(self.vendored_dir, {TYPES_URL: 'vendored.yaml',
+                                              OTHER_URL: 'other.yaml'})
+        blueprint = self._resolve()
+        self.assertEqual([self._file_url(self.vendored_dir, 'vendored.yaml'),
+                          self._file_url(self.vendored_dir, 'other.yaml'),
+                          'local.yaml'], blueprint['imports'])
+        # the storage dir cache takes precedence
+        self._write_index(self.cache_dir, {TYPES_URL: 'cached.yaml'})
+        blueprint = self._resolve()
+        self.assertEqual([self._file_url(self.cache_dir, 'cached.yaml'),
+                          self._file_url(self.vendored_dir, 'other.yaml'),
+                          'local.yaml'], blueprint['imports'])
+
+    def test_resolve_without_copies(self):
+        self._write_index(self.cache_dir, {TYPES_URL: 'cached.yaml'})
+        with self.assertRaises(argh.CommandError) as c:
+            self._resolve()
+        message = str(c.exception)
+        self.assertIn(OTHER_URL, message)
+        self.assertNotIn(TYPES_URL, message)
+        self.assertIn('clue imports refresh', message)
+
+    def _resolve(self):
+        blueprint = {'imports': [TYPES_URL, OTHER_URL, 'local.yaml']}
+        imports.resolve(blueprint, self.storage_dir)
+        return blueprint
+
+    @staticmethod
+    def _write_index(cache_dir, index):
+        cache_dir.makedirs_p()
+        (cache_dir / imports.INDEX_FILE).write_text(yaml.safe_dump(index))
+
+    @staticmethod
+    def _file_url(cache_dir, file_name):
+        return 'file:{0}'.format(urllib.pathname2url(cache_dir / file_name))
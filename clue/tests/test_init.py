@@ -43,8 +43,15 @@ class TestInit(tests.BaseTest):
     def test_yes_docs_no_docs_site(self):
         self._test_docs(docs=True, docs_site=False)
 
-    def _test_docs(self, docs, docs_site):
+    def test_uncached_imports(self):
         self.clue.env.create(repos_dir=self.repos_dir)
+        with self.assertRaises(sh.ErrorReturnCode) as c:
+            self.clue.init()
+        self.assertIn('clue imports refresh', c.exception.stdout)
+        self.assertIn(tests.TYPES_URL, c.exception.stdout)
+
+    def _test_docs(self, docs, docs_site):
+        self.env_create(repos_dir=self.repos_dir)
         inputs = self.inputs()
         repos = {}
         if docs:
@@ -66,7 +73,7 @@ class TestInit(tests.BaseTest):
 
     def _test(self, reset=False, skip_env_create=False):
         if not skip_env_create:
-            self.clue.env.create(repos_dir=self.repos_dir)
+            self.env_create(repos_dir=self.repos_dir)
         inputs = self.inputs()
         inputs['repos'] = {
             'cloudify-dsl-parser': {'type': 'core'},
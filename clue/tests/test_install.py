@@ -23,7 +23,7 @@ class TestInstall(tests.BaseTest):
 
     def test_default(self):
         try:
-            self.clue.env.create(repos_dir=self.repos_dir)
+            self.env_create(repos_dir=self.repos_dir)
             self.clue.apply()
         except sh.ErrorReturnCode as e:
             self.fail(e.stdout)
@@ -0,0 +1,196 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import time
+import unittest
+
+import sh
+
+from clue import output
+from clue import tests
+
+common = tests.import_operations('common')
+
+
+class TestLinesEvent(unittest.TestCase):
+
+    def test_prefix_every_line(self):
+        event = {
+            'context': {'node_name': 'node', 'operation': 'pip.install'},
+            'level': 'info',
+            'message': {'text': u'first\nsecond'}
+        }
+        single = str(output.LinesEvent(dict(event, message={'text': u'x'})))
+        prefix = single[:single.index('x')]
+        nose_event = output.NoseEvent.factory(env=None, verbose=True,
+                                              command={})
+        for event_cls in [output.LinesEvent, nose_event]:
+            lines = str(event_cls(event)).split('\n')
+            self.assertEqual(2, len(lines))
+            for line, text in zip(lines, ['first', 'second']):
+                self.assertTrue(line.startswith(prefix + text))
+        nose_event = output.NoseEvent.factory(env=None, verbose=False,
+                                              command={})
+        self.assertEqual('first\nsecond', str(nose_event(event)))
+
+
+class TestOutputStream(unittest.TestCase):
+
+    def setUp(self):
+        self.logged = []
+
+    def test_size_flush(self):
+        self.patch('OUTPUT_CHUNK_SIZE', 10)
+        self.patch('OUTPUT_FLUSH_INTERVAL', 60)
+        stream = common.OutputStream(self.logged.append)
+        stream.write('1234\n')
+        self.assertEqual([], self.logged)
+        stream.write('5678\n')
+        self.assertEqual(['1234\n5678'], self.logged)
+        stream.write('9\n')
+        stream.flush()
+        self.assertEqual(['1234\n5678', '9'], self.logged)
+        stream.flush()
+        self.assertEqual(2, len(self.logged))
+
+    def test_interval_flush(self):
+        stream = common.OutputStream(self.logged.append)
+        stream.write('first\n')
+        stream.write('second\n')
+        # stale batches are logged by the shared flusher thread
+        deadline = time.time() + 5
+        while not self.logged and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(['first\nsecond'], self.logged)
+        # batches that are not stale yet are kept
+        stream.write('third\n')
+        stream.flush(stale_only=True)
+        self.assertEqual(['first\nsecond'], self.logged)
+
+    def test_throttle(self):
+        stream = common.OutputStream(self.logged.append, max_rate=10000)
+        start = time.time()
+        for _ in range(4):
+            stream._throttle(500)
+        # 2000 bytes at 10000 bytes per second
+        self.assertGreaterEqual(time.time() - start, 0.19)
+        self.assertEqual(2000, stream._rate_bytes)
+        stream = common.OutputStream(self.logged.append, max_rate=0)
+        stream._throttle(500)
+        self.assertIsNone(stream._rate_start)
+
+    def test_stream_order(self):
+        self.patch('OUTPUT_FLUSH_INTERVAL', 60)
+        logged = []
+        stream = common.OutputStream(
+            lambda m: logged.append(('info', m)),
+            lambda m: logged.append(('warn', m)))
+        stream.write('  out1\n')
+        stream.write('out2\n')
+        stream.write_err('err1\n')
+        stream.write('out3\n')
+        stream.flush()
+        self.assertEqual([('info', '  out1\nout2'), ('warn', 'err1'),
+                          ('info', 'out3')], logged)
+
+    def test_logged_command(self):
+        self.patch('OUTPUT_FLUSH_INTERVAL', 60)
+        logger = FakeLogger()
+        command = common.LoggedCommand(sh.sh, logger).bake('-c')
+        command('echo out1; sleep 0.1; echo err1 >&2; sleep 0.1; '
+                'echo out2').wait()
+        # the last batch is logged when the call returns
+        self.assertEqual([('info', 'out1'), ('warn', 'err1'),
+                          ('info', 'out2')], logger.logged)
+        logger.logged = []
+        with self.assertRaises(sh.ErrorReturnCode):
+            command('echo out; exit 1')
+        self.assertEqual([('info', 'out')], logger.logged)
+
+    def patch(self, name, value):
+        original = getattr(common, name)
+        setattr(common, name, value)
+        self.addCleanup(setattr, common, name, original)
+
+
+class TestNamedNodeEvent(unittest.TestCase):
+
+    def test_workflow_logs(self):
+        event_cls = output.NamedNodeEvent.factory(
+            env=FakeEnv(), verbose=False,
+            command={'workflow': 'git_pull', 'parameters': {}})
+        summary = {
+            'context': {'workflow_id': 'git_pull'},
+            'level': 'info',
+            'message': {'text': u'Updated: repo1'}
+        }
+        self.assertEqual('Updated: repo1', str(event_cls(summary)))
+        other = dict(summary, context={'workflow_id': 'git_checkout'})
+        formatted = str(event_cls(other))
+        self.assertIn('git_checkout', formatted)
+        self.assertIn('INFO', formatted)
+
+    def test_node_logs(self):
+        event_cls = output.NamedNodeEvent.factory(
+            env=FakeEnv(), verbose=False,
+            command={'workflow': 'execute_operation',
+                     'parameters': {'operation': 'git.status'}})
+        event = {
+            'context': {'workflow_id': 'execute_operation',
+                        'node_name': 'repo1-repo'},
+            'level': 'info',
+            'message': {'text': u' M file\n?? new'}
+        }
+        lines = str(event_cls(event)).split('\n')
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith('|  M file'))
+        self.assertTrue(lines[1].endswith('| ?? new'))
+        self.assertIn('repo1', lines[0])
+
+
+class FakeNode(object):
+
+    def __init__(self, node_id, name):
+        self.id = node_id
+        self.type = 'git_repo'
+        self.properties = {'name': name}
+
+
+class FakeStorage(object):
+
+    nodes = [FakeNode('repo1-repo', 'repo1'), FakeNode('repo2-repo', 'repo2')]
+
+    def get_nodes(self):
+        return self.nodes
+
+    def get_node(self, node_id):
+        return [node for node in self.nodes if node.id == node_id][0]
+
+
+class FakeEnv(object):
+    storage = FakeStorage()
+
+
+class FakeLogger(object):
+
+    def __init__(self):
+        self.logged = []
+
+    def info(self, message):
+        self.logged.append(('info', message))
+
+    def warn(self, message):
+        self.logged.append(('warn', message))
@@ -15,10 +15,8 @@
 ############
 
 import sys
-import os
 
 import sh
-from path import path
 
 from clue import tests
 
@@ -67,9 +65,12 @@ class TestPip(tests.BaseTest):
         self.assertIn('requests==2.5.3', freeze_output)
         self.assertIn('xmldict==0.4.1', freeze_output)
 
-        clue_source_path = path(sys.executable).dirname() / 'clue'
-        clue_symlink_path = bin_dir / 'clue'
-        self.assertEqual(os.readlink(clue_symlink_path), clue_source_path)
+        clue_launcher_path = bin_dir / 'clue'
+        self.assertFalse(clue_launcher_path.islink())
+        self.assertTrue(clue_launcher_path.text().startswith(
+            '#! {0}\n'.format(sys.executable)))
+        self.assertIn('usage: clue',
+                      sh.Command(clue_launcher_path)('-h').stdout)
 
         postactivate_path = bin_dir / 'postactivate'
         self.assertIn('crazy-crazy', postactivate_path.text())
@@ -0,0 +1,116 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import unittest
+
+from clue import tests
+
+porcelain = tests.import_operations('porcelain')
+
+OID = '4aec2e046b8225b87b62da6f6d06e4a0b8a8bca4'
+BLOB = 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+ZERO = '0' * 40
+
+
+class TestPorcelain(unittest.TestCase):
+
+    def test_ahead_behind(self):
+        state = self._parse(['# branch.upstream origin/master',
+                             '# branch.ab +2 -1'])
+        self.assertEqual('origin/master', state.upstream)
+        self.assertEqual((2, 1), (state.ahead, state.behind))
+        self.assertEqual('<>', state.upstream_indicator)
+        state = self._parse(['# branch.upstream origin/master',
+                             '# branch.ab +0 -0'])
+        self.assertEqual('=', state.upstream_indicator)
+        state = self._parse(['# branch.upstream origin/master',
+                             '# branch.ab +0 -3'])
+        self.assertEqual('<', state.upstream_indicator)
+
+    def test_no_upstream(self):
+        state = self._parse([])
+        self.assertIsNone(state.upstream)
+        self.assertIsNone(state.ahead)
+        self.assertEqual('', state.upstream_indicator)
+        self.assertFalse(state.dirty)
+        self.assertEqual([], state.short_status())
+
+    def test_detached_and_initial(self):
+        state = porcelain.parse('# branch.oid {0}\n'
+                                '# branch.head (detached)\n'.format(OID))
+        self.assertTrue(state.detached)
+        self.assertIn('(4aec2e0...)', state.branch_state())
+        state = porcelain.parse('# branch.oid (initial)\n'
+                                '# branch.head master\n')
+        self.assertTrue(state.initial)
+
+    def test_changed_entries(self):
+        state = self._parse([
+            '1 .M N... 100644 100644 100644 {0} {0} module.py'.format(BLOB),
+            '1 A. N... 000000 100644 100644 {0} {1} added file'.format(
+                ZERO, BLOB)])
+        self.assertTrue(state.staged)
+        self.assertTrue(state.unstaged)
+        self.assertFalse(state.untracked)
+        self.assertEqual([' M module.py', 'A  "added file"'],
+                         state.short_status())
+
+    def test_renames(self):
+        state = self._parse([
+            '2 R. N... 100644 100644 100644 {0} {0} R100 renamed\tplain'
+            .format(BLOB),
+            '2 RM N... 100644 100644 100644 {0} {0} R87 new name\told name'
+            .format(BLOB),
+            '2 R. N... 100644 100644 100644 {0} {0} R100 "\\303\\2512"\t'
+            '"q\\"x"'.format(BLOB)])
+        self.assertEqual(['R  plain -> renamed',
+                          'RM "old name" -> "new name"',
+                          'R  "q\\"x" -> "\\303\\2512"'],
+                         state.short_status())
+
+    def test_unmerged(self):
+        state = self._parse([
+            'u UU N... 100644 100644 100644 100644 {0} {0} {0} conflict.py'
+            .format(BLOB),
+            'u AA N... 000000 100644 100644 100644 {0} {0} {0} both added'
+            .format(ZERO)])
+        self.assertTrue(state.staged)
+        self.assertTrue(state.unstaged)
+        self.assertEqual(['UU conflict.py', 'AA "both added"'],
+                         state.short_status())
+
+    def test_untracked(self):
+        state = self._parse(['? plain', '? new file', '? "tab\\tx"',
+                             '? "\\303\\251"'])
+        self.assertTrue(state.untracked)
+        self.assertFalse(state.staged)
+        self.assertFalse(state.unstaged)
+        self.assertEqual(['?? plain', '?? "new file"', '?? "tab\\tx"',
+                          '?? "\\303\\251"'],
+                         state.short_status())
+        self.assertIn('%', state.branch_state())
+
+    def test_stash(self):
+        self.assertEqual(0, self._parse([]).stash)
+        state = self._parse(['# stash 3'])
+        self.assertEqual(3, state.stash)
+        self.assertIn('$', state.branch_state())
+
+    def _parse(self, lines):
+        return porcelain.parse('\n'.join([
+            '# branch.oid {0}'.format(OID),
+            '# branch.head master'] + lines) + '\n')
@@ -0,0 +1,150 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sh
+from path import path
+
+from clue import tests
+
+refs = tests.import_operations('refs')
+
+
+class TestRefs(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = path(tempfile.mkdtemp(prefix='clue-refs-'))
+        self.addCleanup(self.workdir.rmtree_p)
+        self.git = sh.git.bake('-c', 'user.name=John Doe',
+                               '-c', 'user.email=john@example.com',
+                               _cwd=self.workdir)
+        self.git.init()
+        for i in range(3):
+            (self.workdir / 'file').write_text(str(i))
+            self.git.add('file')
+            self.git.commit('-m', str(i))
+        for i in range(50):
+            self.git.branch('branch{0:02}'.format(i), 'HEAD~1')
+        self.git.tag('-a', 'annotated', '-m', 'annotated', 'HEAD~2')
+        self.git.tag('lightweight', 'HEAD~2')
+        self.git('pack-refs', '--all')
+        # loose refs, one of which shadows its packed value
+        self.git.branch('loose')
+        self.git.branch('-f', 'branch10', 'HEAD')
+        self.git_dir = self.workdir / '.git'
+
+    def rev_parse(self, rev):
+        return self.git('rev-parse', rev).stdout.strip()
+
+    def test_packed_and_loose(self):
+        store = refs.RefStore(self.git_dir)
+        self.assertTrue(store.supported)
+        self.assertFalse((self.git_dir / 'refs' / 'heads' /
+                          'branch01').exists())
+        self.assertTrue((self.git_dir / 'refs' / 'heads' / 'loose').exists())
+        for name in ['branch01', 'loose', 'branch10', 'lightweight']:
+            self.assertEqual(self.rev_parse(name), store.resolve(name))
+        self.assertEqual(self.rev_parse('HEAD'),
+                         store.read_ref('refs/heads/branch10'))
+        self.assertEqual(self.rev_parse('HEAD~1'),
+                         store.packed_refs.get('refs/heads/branch10'))
+        self.assertEqual(self.rev_parse('HEAD'), store.read_ref('HEAD'))
+        self.assertEqual('master', store.current_branch())
+        all_refs = store.refs('refs/heads/')
+        self.assertEqual(self.rev_parse('HEAD'),
+                         all_refs['refs/heads/branch10'])
+        self.assertEqual(52, len(all_refs))
+
+    def test_peeled(self):
+        store = refs.RefStore(self.git_dir)
+        self.assertEqual(self.rev_parse('annotated'),
+                         store.resolve('annotated'))
+        self.assertEqual(self.rev_parse('annotated^{commit}'),
+                         store.peeled('refs/tags/annotated'))
+        self.assertIsNone(store.peeled('refs/tags/lightweight'))
+        self.assertIsNone(store.peeled('refs/tags/missing'))
+
+    def test_missing(self):
+        store = refs.RefStore(self.git_dir)
+        self.assertIsNone(store.read_ref('refs/heads/missing'))
+        self.assertIsNone(store.resolve('missing'))
+        self.assertFalse(store.exists('refs/heads/missing'))
+        loose = self.rev_parse('loose')
+        (self.git_dir / 'packed-refs').remove()
+        self.assertIsNone(store.read_ref('refs/heads/branch01'))
+        self.assertEqual(loose, store.resolve('loose'))
+
+    def test_bisect(self):
+        self.patch_mmap_threshold(0)
+        store = refs.RefStore(self.git_dir)
+        packed = store.packed_refs
+        expected = dict(line.split(' ')[::-1] for line in
+                        self.git('show-ref').stdout.strip().split('\n'))
+        # bisect every packed ref, including the first and last ones
+        for name in sorted(expected):
+            if name in ['refs/heads/loose', 'refs/heads/branch10']:
+                continue
+            self.assertEqual(expected[name], packed.get(name))
+            self.assertIsNotNone(packed._mmap)
+        for name in ['refs/a', 'refs/heads/branch011', 'refs/heads/loose',
+                     'refs/tags/annotatedx', 'refs/zzz']:
+            self.assertIsNone(packed.get(name))
+        self.assertEqual(self.rev_parse('annotated^{commit}'),
+                         packed.peeled('refs/tags/annotated'))
+        self.assertIsNone(packed.peeled('refs/tags/lightweight'))
+        self.assertEqual(51, len(packed.refs('refs/heads/')))
+
+    def test_packed_refs_cache(self):
+        store = refs.RefStore(self.git_dir)
+        name = 'refs/heads/branch01'
+        packed_refs = self.git_dir / 'packed-refs'
+        os.utime(packed_refs, (1000, 1000))
+        self.assertEqual(self.rev_parse('HEAD~1'), store.read_ref(name))
+        content = packed_refs.text().replace(self.rev_parse('HEAD~1'),
+                                             self.rev_parse('HEAD~2'))
+        # same mtime, size and inode, the cached refs are used
+        with open(packed_refs, 'r+') as f:
+            f.write(content)
+        os.utime(packed_refs, (1000, 1000))
+        self.assertEqual(self.rev_parse('HEAD~1'), store.read_ref(name))
+        # a new file (inode) with the same size and mtime is reloaded
+        new_packed_refs = self.workdir / 'packed-refs.new'
+        shutil.copy(packed_refs, new_packed_refs)
+        os.utime(new_packed_refs, (1000, 1000))
+        os.rename(new_packed_refs, packed_refs)
+        self.assertEqual(self.rev_parse('HEAD~2'), store.read_ref(name))
+
+    def test_loose_ref_cache(self):
+        store = refs.RefStore(self.git_dir)
+        name = 'refs/heads/loose'
+        ref_path = self.git_dir / name
+        os.utime(ref_path, (1000, 1000))
+        self.assertEqual(self.rev_parse('HEAD'), store.read_ref(name))
+        with open(ref_path, 'r+') as f:
+            f.write(self.rev_parse('HEAD~2'))
+        os.utime(ref_path, (1000, 1000))
+        self.assertEqual(self.rev_parse('HEAD'), store.read_ref(name))
+        os.utime(ref_path, (2000, 2000))
+        self.assertEqual(self.rev_parse('HEAD~2'), store.read_ref(name))
+
+    def patch_mmap_threshold(self, value):
+        threshold = refs.MMAP_THRESHOLD
+        refs.MMAP_THRESHOLD = value
+        self.addCleanup(setattr, refs, 'MMAP_THRESHOLD', threshold)
@@ -0,0 +1,107 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import unittest
+
+from clue import tests
+
+scheduler = tests.import_operations('scheduler')
+
+
+class Failure(Exception):
+    pass
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_backoff_delay(self):
+        for attempt in range(10):
+            expected = min(30, 1 * 2 ** attempt)
+            for _ in range(100):
+                delay = scheduler.backoff_delay(attempt, 1, 30)
+                self.assertGreaterEqual(delay, expected / 2.0)
+                self.assertLessEqual(delay, expected)
+        delays = set(scheduler.backoff_delay(3, 1, 30) for _ in range(100))
+        self.assertGreater(len(delays), 1)
+        self.assertLessEqual(scheduler.backoff_delay(100, 1, 5), 5)
+
+    def test_run_with_backoff_succeeds_after_retries(self):
+        calls = []
+        retries = []
+
+        def func():
+            calls.append(True)
+            if len(calls) < 3:
+                raise Failure()
+            return 'result'
+        result = self._run(func, retries=5,
+                           on_retry=lambda *args: retries.append(args))
+        self.assertEqual('result', result)
+        self.assertEqual(3, len(calls))
+        self.assertEqual([1, 2], [attempt for attempt, _, _ in retries])
+        for _, delay, error in retries:
+            self.assertEqual(0, delay)
+            self.assertIsInstance(error, Failure)
+
+    def test_run_with_backoff_gives_up(self):
+        calls = []
+
+        def func():
+            calls.append(True)
+            raise Failure()
+        with self.assertRaises(Failure):
+            self._run(func, retries=3)
+        self.assertEqual(4, len(calls))
+        calls = []
+        with self.assertRaises(Failure):
+            self._run(func, retries=0)
+        self.assertEqual(1, len(calls))
+
+    def test_run_with_backoff_does_not_retry_other_errors(self):
+        calls = []
+
+        def func():
+            calls.append(True)
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            self._run(func, retries=3)
+        self.assertEqual(1, len(calls))
+
+    def test_run_with_backoff_releases_host(self):
+        semaphore = scheduler.host_semaphore('release.example.com', 1)
+
+        def func():
+            # the host connection is held while the function runs only
+            self.assertFalse(semaphore.acquire(False))
+            raise Failure()
+        with self.assertRaises(Failure):
+            self._run(func, retries=2, host='release.example.com')
+        self.assertTrue(semaphore.acquire(False))
+        semaphore.release()
+
+    def test_remote_host(self):
+        for url in ['https://github.com/org/repo.git',
+                    'ssh://git@GitHub.com:22/org/repo.git',
+                    'git@github.com:org/repo.git']:
+            self.assertEqual('github.com', scheduler.remote_host(url))
+        self.assertEqual('', scheduler.remote_host('/path/to/repo.git'))
+
+    @staticmethod
+    def _run(func, retries, on_retry=None, host='example.com'):
+        return scheduler.run_with_backoff(func, host=host, limit=1,
+                                          retries=retries, interval=0,
+                                          max_interval=0, retry_on=Failure,
+                                          on_retry=on_retry)
@@ -0,0 +1,76 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import os
+import time
+
+import sh
+import yaml
+from path import path
+
+from clue import config
+from clue import tests
+
+
+class TestServer(tests.BaseTest):
+
+    def test_server(self):
+        features_yaml = self.workdir / 'features.yaml'
+        features_yaml.write_text(yaml.safe_dump({
+            'test1': {'repos': {'cloudify-dsl-parser': '3.3.1-build'}}
+        }))
+        self.clue_install()
+        no_server_env = dict((k, str(v)) for k, v in os.environ.items())
+        no_server_env['CLUE_NO_SERVER'] = 'true'
+        expected = self.clue.feature.list(_env=no_server_env).stdout
+        server = self.clue('server', _bg=True)
+        try:
+            self._wait_for_socket()
+            with self.assertRaises(sh.ErrorReturnCode) as c:
+                self.clue('server')
+            self.assertIn('already running', c.exception.stdout)
+            self.assertEqual(expected, self.clue.feature.list().stdout)
+
+            features_yaml.write_text(yaml.safe_dump({
+                'test1': {'repos': {'cloudify-dsl-parser': '3.3.1-build'}},
+                'test2': {'repos': {'cloudify-rest-client': '3.3.1-build'}}
+            }))
+            self.assertIn('test2', self.clue.feature.list().stdout)
+
+            self.set_inputs(self.inputs())
+            self.assertIn('test2', self.clue.feature.list().stdout)
+
+            with self.assertRaises(sh.ErrorReturnCode) as c:
+                self.clue.feature.checkout('missing')
+            self.assertIn('No such feature', c.exception.stdout)
+        finally:
+            server.process.terminate()
+            try:
+                server.wait()
+            except sh.ErrorReturnCode:
+                pass
+        self.assertFalse(self._socket_path().exists())
+
+    def _socket_path(self):
+        return path(self.clue_conf_path + config.SERVER_SOCKET_SUFFIX)
+
+    def _wait_for_socket(self, timeout=10):
+        deadline = time.time() + timeout
+        while not self._socket_path().exists():
+            if time.time() > deadline:
+                self.fail('Timed out waiting for the clue server')
+            time.sleep(0.2)
@@ -0,0 +1,211 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+
+import json
+import os
+import socket
+import sys
+import threading
+
+import sh
+
+from clue import prompt
+from clue import tests
+
+# the command line needs clash, which pulls in argh, yaml and the cloudify
+# workflow and dsl parser packages. import times are compared to importing
+# clash in the same run: a single module that clue imports on top of clash
+# may take at most this fraction of it
+MODULE_MARGIN = 0.25
+COMMANDS = [
+    ['-h'],
+    ['feature', 'list', '-h'],
+    ['git', 'status', '-h'],
+    ['nose', '-h'],
+]
+# completion and git prompt are answered before the command line is loaded
+HOT_PATH_EXCLUDED = ['clash', 'argh', 'cloudify', 'dsl_parser',
+                     'multiprocessing', 'sqlite3']
+# modules that clue only needs for a few commands
+LAZY_MODULES = ['multiprocessing', 'sqlite3']
+
+# python 2 has no -X importtime, so imports are timed by wrapping __import__.
+# Records the total time and the cumulative time of each first import of a
+# module, including submodules imported with 'from package import module'.
+PROFILE_SCRIPT = '''
+import __builtin__
+import json
+import os
+import sys
+import time
+
+start = time.time()
+imports = {}
+original_import = __builtin__.__import__
+
+
+def timed_import(name, globals=None, locals=None, fromlist=None, level=-1):
+    names = ['{0}.{1}'.format(name, item) for item in fromlist or ()
+             if item != '*']
+    names = [n for n in [name] + names if n not in sys.modules]
+    if not names:
+        return original_import(name, globals, locals, fromlist, level)
+    import_start = time.time()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        for n in names:
+            imports.setdefault(n, time.time() - import_start)
+
+
+def dump():
+    modules = sorted(n for n, m in sys.modules.items() if m is not None)
+    with open(os.environ['CLUE_PROFILE_PATH'], 'w') as f:
+        json.dump({'total': time.time() - start,
+                   'imports': dict((n, t) for n, t in imports.items()
+                                   if n in modules),
+                   'modules': modules}, f)
+
+
+original_exit = os._exit
+
+
+def exit(code):
+    dump()
+    original_exit(code)
+
+__builtin__.__import__ = timed_import
+os._exit = exit
+target = sys.argv[1]
+sys.argv = ['clue'] + sys.argv[2:]
+try:
+    if target == 'main':
+        from clue import main
+        main()
+    else:
+        for name in target.split(','):
+            __import__(name)
+except SystemExit:
+    pass
+dump()
+'''
+
+
+class TestStartup(tests.BaseTest):
+
+    def setUp(self):
+        super(TestStartup, self).setUp()
+        self.env_create(repos_dir=self.repos_dir)
+        self.profile_path = self.workdir / 'profile.json'
+
+    def test_command_startup(self):
+        clash = self._clash_profile()
+        for command in COMMANDS:
+            profile = min((self._profile('main', *command)
+                           for _ in range(3)), key=lambda p: p['total'])
+            # modules that clash imports are covered by the baseline
+            self._assert_module_budget(profile, clash, command,
+                                       exclude=clash['modules'])
+            # no server is running, which is found without loading its module
+            self.assertNotIn('clue.server', profile['modules'])
+
+    def test_lazy_imports(self):
+        profile = self._profile('clue.feature,clue.completion,clue.output,'
+                                'clue.hooks,clue.store')
+        self._assert_excluded(profile, LAZY_MODULES)
+        profile = self._profile('clue')
+        self._assert_excluded(profile, HOT_PATH_EXCLUDED)
+
+    def test_completion_startup(self):
+        index_dir = self.storage_dir() / '.local'
+        index_dir.mkdir_p()
+        (index_dir / 'completion-index.json').write_text(json.dumps({
+            'sources': {},
+            'packages': ['cloudify-dsl-parser']
+        }))
+        comp_line = 'clue nose cloudify-d'
+        completions_path = self.workdir / 'completions'
+        env = {
+            '_ARGCOMPLETE': '1',
+            '_ARGCOMPLETE_STDOUT_FILENAME': str(completions_path),
+            'COMP_LINE': comp_line,
+            'COMP_POINT': str(len(comp_line))
+        }
+        profile = self._profile('main', env=env)
+        self.assertEqual('cloudify-dsl-parser ', completions_path.text())
+        self._assert_excluded(profile, HOT_PATH_EXCLUDED)
+        self._assert_module_budget(profile, self._clash_profile(),
+                                   ['completion'])
+
+    def test_prompt_startup(self):
+        socket_path = self.storage_dir() / '.local' / prompt.SOCKET_NAME
+        socket_path.dirname().mkdir_p()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path)
+        listener.listen(4)
+        self.addCleanup(listener.close)
+
+        def serve():
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except socket.error:
+                    return
+                connection.sendall(json.dumps({'repos': {
+                    'repo1': {'branch_state': '(master)'}}}))
+                connection.close()
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        output = self.clue.git.prompt().stdout
+        self.assertIn('repo1', output)
+        self.assertIn('(master)', output)
+        # answered from the daemon without loading the command line
+        profile = self._profile('main', 'git', 'prompt')
+        self._assert_excluded(profile, HOT_PATH_EXCLUDED)
+        self._assert_module_budget(profile, self._clash_profile(),
+                                   ['git', 'prompt'])
+
+    def _profile(self, target, *args, **kwargs):
+        env = dict((k, str(v)) for k, v in os.environ.items())
+        env.update(kwargs.get('env', {}))
+        env['CLUE_PROFILE_PATH'] = str(self.profile_path)
+        sh.Command(sys.executable)('-c', PROFILE_SCRIPT, target, *args,
+                                   _env=env)
+        return json.loads(self.profile_path.text())
+
+    def _clash_profile(self):
+        return min((self._profile('clash') for _ in range(3)),
+                   key=lambda p: p['total'])
+
+    def _assert_module_budget(self, profile, clash, command, exclude=()):
+        budget = clash['imports']['clash'] * MODULE_MARGIN
+        exclude = set(exclude)
+        slow = sorted(((t, n) for n, t in profile['imports'].items()
+                       if t > budget and n not in exclude), reverse=True)
+        self.assertFalse(
+            slow,
+            'clue {0} imports modules that take more than {1:.3f}s '
+            '({2} of importing clash):\n{3}'.format(
+                ' '.join(command), budget, MODULE_MARGIN,
+                '\n'.join('{0:.3f}s {1}'.format(t, n) for t, n in slow)))
+
+    def _assert_excluded(self, profile, excluded):
+        loaded = [n for n in profile['modules']
+                  if any(n == e or n.startswith(e + '.') for e in excluded)]
+        self.assertFalse(loaded, 'unexpected imports: {0}'.format(
+            ', '.join(loaded)))
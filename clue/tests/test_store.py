@@ -0,0 +1,85 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+############
+
+import os
+import stat
+import tempfile
+import threading
+import unittest
+
+from path import path
+
+from clue import store
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = path(tempfile.mkdtemp(prefix='clue-store-'))
+        self.addCleanup(self.workdir.rmtree_p)
+        self.features_file = self.workdir / 'features.yaml'
+
+    def test_atomic_write_keeps_mode(self):
+        file_path = self.workdir / 'file'
+        file_path.write_text('old')
+        os.chmod(file_path, 0o644)
+        store.atomic_write(file_path, 'new')
+        self.assertEqual('new', file_path.text())
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(file_path).st_mode))
+        new_file_path = self.workdir / 'dir' / 'new_file'
+        umask = os.umask(0o022)
+        try:
+            store.atomic_write(new_file_path, 'new')
+        finally:
+            os.umask(umask)
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(new_file_path).st_mode))
+
+    def test_atomic_write_failure(self):
+        file_path = self.workdir / 'file'
+        file_path.write_text('old')
+        with self.assertRaises(TypeError):
+            store.atomic_write(file_path, None)
+        self.assertEqual('old', file_path.text())
+        self.assertEqual(['file'], os.listdir(self.workdir))
+
+    def test_yaml_store_save(self):
+        yaml_store = store.YamlStore(self.features_file)
+        self.assertEqual({}, yaml_store.load())
+        yaml_store.save({'feature': {'branch': 'branch'}})
+        os.chmod(self.features_file, 0o640)
+        with yaml_store.transaction() as content:
+            content['other'] = {'branch': 'other'}
+        self.assertEqual(['feature', 'other'],
+                         store.YamlStore(self.features_file).names())
+        self.assertEqual(0o640,
+                         stat.S_IMODE(os.stat(self.features_file).st_mode))
+
+    def test_yaml_store_transactions_are_serialized(self):
+        store.YamlStore(self.features_file).save({'counter': 0})
+
+        def increment():
+            # one store per thread, as separate clue processes would have
+            yaml_store = store.YamlStore(self.features_file)
+            for _ in range(20):
+                with yaml_store.transaction() as content:
+                    content['counter'] += 1
+        threads = [threading.Thread(target=increment) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(100, store.YamlStore(self.features_file).get(
+            'counter'))
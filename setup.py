@@ -31,9 +31,5 @@ setup(
         'clash==0.16'
     ],
     include_package_data=True,
-    entry_points={
-        'console_scripts': [
-            'clue = clue:main',
-        ]
-    }
+    scripts=['scripts/clue']
 )